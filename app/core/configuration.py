@@ -58,6 +58,9 @@ class Settings(BaseSettings):
 
     LLM_API_KEY: str = Field(default="", env="LLM_API_KEY")
 
+    # CPU 서빙 시 MultiVAE를 int8 dynamic quantization 하여 사용
+    RECOMMENDER_QUANTIZE: bool = Field(default=False, env="RECOMMENDER_QUANTIZE")
+
     class Config:
         # .env file을 사용할 때
         env_file = ".env"
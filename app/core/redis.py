@@ -1,6 +1,7 @@
 # app/core/redis.py
 
 # import redis.asyncio as redis
+from redis import Redis as SyncRedis
 from redis.asyncio import Redis
 from app.core.configuration import settings
 from functools import lru_cache
@@ -13,6 +14,18 @@ def get_redis_client() -> Redis:
         decode_responses=True
     )
 
+@lru_cache()
+def get_sync_redis_client() -> SyncRedis:
+    """
+    추천 모델(동기 코드)에서 사용하는 Redis client
+    바이너리 값을 저장하므로 decode_responses를 끄고 사용
+    """
+    return SyncRedis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        decode_responses=False
+    )
+
 
 # redis_client = redis.Redis(
 #     host=settings.REDIS_HOST,
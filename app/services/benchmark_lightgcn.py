@@ -0,0 +1,7 @@
+import pandas as pd
+from boj_llmrec.recommender.LightGCN.benchmark import benchmark_training_modes
+
+solved_info = pd.read_csv('data/solved_info.csv', index_col=0)
+solved_info.columns = ['user_id', 'item_id']
+for mode, result in benchmark_training_modes(solved_info).items():
+    print(f"{mode}: {result['sec']:.1f}s, recall@10 {result['recall@10']:.4f}, ndcg@10 {result['ndcg@10']:.4f}")
@@ -4,6 +4,7 @@ import re
 import pandas as pd
 
 from ..recommender.recommender import Recommender
+from ..recommender.ranking import RankedProblems
 from .llm_utils import get_filtered_problems
 
 class LLM:
@@ -65,6 +66,7 @@ class LLM:
         유저가 문제를 요청하면, 기계적으로 문제 목록만 나열하지 말고, 대화하며 추천해 주세요.
         만약 tool 호출의 결과가 비어있는 경우, 유저의 핸들이 존재하지 않거나, solved.ac 서버의 문제인 경우가 많습니다.
         이 경우, 유저에게 핸들을 확인해 달라고 요청하세요.
+        단, 태그나 난이도 조건을 지정한 경우에는 조건에 맞는 문제가 없을 수도 있으니, 조건을 완화해 보자고 제안하세요.
 
         문제의 난이도는 'Bronze 5'부터 'Ruby 1'까지의 범위로 설정되어 있습니다.
         예시는 다음과 같습니다: 'Bronze 5', 'Silver 2', 'Ruby 2', 'Platinum 1'.
@@ -180,7 +182,15 @@ class LLM:
 
     def chat(self, user_input: str, prev_msgs: list, user_handle: str, profile: dict) -> tuple[str, list]:
         keywords = []
-        recommended_problems = self.recommender.get_recommended_problems(user_handle)
+        recommended_problems = None
+
+        def get_recommended_problems() -> RankedProblems:
+            # Only computed when a tool call actually needs it, then reused for the rest of the turn.
+            nonlocal recommended_problems
+            if recommended_problems is None:
+                recommended_problems = self.recommender.get_recommended_problems(user_handle)
+            return recommended_problems
+
         if not prev_msgs:
             profile_prompt = self._get_profile_prompt(profile)
             prev_msgs = [{"role": "developer", "content": self.prompt + profile_prompt}]
@@ -198,15 +208,15 @@ class LLM:
         if response.choices[0].message.function_call:
             args = json.loads(response.choices[0].message.function_call.arguments)
             if args.get('type') == 'recommend':
-                args['sorted_problem_info'] = recommended_problems
+                args['ranked_problems'] = get_recommended_problems()
             elif args.get('type') == 'similar':
                 target_problem_id = args.get('target_problem_id')
                 similar_problems = self.recommender.get_similar_problems(target_problem_id)
-                args['sorted_problem_info'] = similar_problems
+                args['ranked_problems'] = similar_problems
             elif args.get('type') == 'user':
                 target_user_handle = args.get('target_user_handle')
-                user_problems = self.recommender.get_other_user_problems(recommended_problems, user_handle, target_user_handle)
-                args['sorted_problem_info'] = user_problems
+                user_problems = self.recommender.get_other_user_problems(get_recommended_problems(), user_handle, target_user_handle)
+                args['ranked_problems'] = user_problems
             else:
                 raise ValueError(f"Invalid type: {args.get('type')}. Must be 'recommend', 'similar', or 'user'.")
             
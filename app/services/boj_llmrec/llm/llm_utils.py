@@ -1,6 +1,8 @@
 from pyparsing import Word, alphas, infixNotation, opAssoc, Literal
 import pandas as pd
 
+from ..recommender.ranking import RankedProblems
+
 def level_to_tier(level: int) -> str:
     level_map = {
         0: "Bronze",
@@ -33,29 +35,29 @@ expr = infixNotation(
      (Literal("||"), 2, opAssoc.LEFT)]
 )
 
-def get_filtered_problems(sorted_problem_info: pd.DataFrame,
+def get_filtered_problems(ranked_problems: RankedProblems,
                              topk: int = 10,
                              tags: str = "",
                              max_difficulty: str = "",
                              min_difficulty: str = "",
                              alternative: int = 0,
                              **kwargs) -> str:
-    def tag_mask(tag: str) -> pd.Series:
+    def tag_mask(sorted_problem_info: pd.DataFrame, tag: str) -> pd.Series:
         return sorted_problem_info["tags"].str.contains(tag, regex=False).convert_dtypes().fillna(False)
 
-    def evaluate(cond) -> pd.Series:
+    def evaluate(sorted_problem_info: pd.DataFrame, cond) -> pd.Series:
         if isinstance(cond, str):
-            return tag_mask(cond)
+            return tag_mask(sorted_problem_info, cond)
         if not isinstance(cond, list):
             cond = list(cond)
         if not cond:
             raise ValueError("Empty sub-expression detected")
 
-        res = evaluate(cond[0])
+        res = evaluate(sorted_problem_info, cond[0])
         i = 1
         while i < len(cond):
             op, right_raw = cond[i], cond[i + 1]
-            right = evaluate(right_raw)
+            right = evaluate(sorted_problem_info, right_raw)
 
             if op == "&&":
                 res = res & right
@@ -66,34 +68,50 @@ def get_filtered_problems(sorted_problem_info: pd.DataFrame,
             i += 2
         return res
 
-    if not tags:
-        mask = pd.Series(True, index=sorted_problem_info.index)
-    else:
-        parsed = expr.parseString(tags, parseAll=True).asList()[0]
-        mask = evaluate(parsed)
+    def filter_problems(sorted_problem_info: pd.DataFrame) -> pd.DataFrame:
+        if not tags:
+            mask = pd.Series(True, index=sorted_problem_info.index)
+        else:
+            mask = evaluate(sorted_problem_info, parsed)
+        sorted_problem_info = sorted_problem_info[
+            (sorted_problem_info["level"] >= min_level) &
+            (sorted_problem_info["level"] <= max_level)
+        ]
+        mask = mask.reindex(sorted_problem_info.index, fill_value=False)
+        return sorted_problem_info[mask]
 
+    parsed = expr.parseString(tags, parseAll=True).asList()[0] if tags else None
     min_level = tier_to_level(min_difficulty) if min_difficulty else 0
     max_level = tier_to_level(max_difficulty) if max_difficulty else 1000
-    sorted_problem_info = sorted_problem_info[
-        (sorted_problem_info["level"] >= min_level) &
-        (sorted_problem_info["level"] <= max_level)
-    ]
-    mask = mask.reindex(sorted_problem_info.index, fill_value=False)
-    filtered = sorted_problem_info[mask].iloc[topk * alternative: topk * (alternative + 1)]
+
+    # Only materialize catalogue rows for a growing prefix of the ranking until the page is filled
+    needed_cnt = topk * (alternative + 1)
+    candidate_cnt = max(needed_cnt * 4, 100)
+    while True:
+        sorted_problem_info = ranked_problems.rows(candidate_cnt)
+        filtered = filter_problems(sorted_problem_info)
+        if len(filtered) >= needed_cnt or candidate_cnt >= len(ranked_problems):
+            break
+        candidate_cnt *= 4
+    filtered = filtered.iloc[topk * alternative: topk * (alternative + 1)]
     return "\n".join(
         f"ID: {row.problemId}, Title: {row.titleKo}, Tags: {row.tags}, Difficulty: {level_to_tier(row.level)}"
         for _, row in filtered.iterrows()
     )
 
 if __name__ == "__main__":
+    import numpy as np
+
     condition = "dp || greedy || math"
 
-    sorted_problem_info = pd.DataFrame({
+    problem_info = pd.DataFrame({
         "problemId": [1, 2, 3],
         "titleKo":   ["문제1", "문제2", "문제3"],
         "tags":      ["dp", "greedy", "math"],
+        "level":     [1, 6, 11],
     })
+    ranked_problems = RankedProblems(np.array([0.1, 0.3, 0.2]), problem_info, np.arange(3))
 
     topk = 2
-    result = get_filtered_problems(condition, sorted_problem_info, topk)
+    result = get_filtered_problems(ranked_problems, topk, condition)
     print(result)
@@ -2,6 +2,7 @@ import os
 import pandas as pd
 
 from .recommender import Recommender
+from .recommender.bundle import ServingBundle
 from .llm import LLM
 
 class Session:
@@ -21,13 +22,21 @@ class Session:
         return text_response, speech_response, keywords
 
 class LLMRec:
-    def __init__(self, api_key: str) -> None:
+    def __init__(self, api_key: str, redis_client=None, quantize: bool = False) -> None:
         self.TOP_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
         self.DATA_PATH = os.path.join(self.TOP_PATH, 'data')
         self.MODEL_PATH = os.path.join(self.TOP_PATH, 'saved')
-        self.recommender = Recommender(self.DATA_PATH)
-        self.llm = LLM(api_key=api_key, recommender=self.recommender)
-        self._load_model()
+        self.BUNDLE_PATH = os.path.join(self.MODEL_PATH, 'serving')
+        if ServingBundle.exists(self.BUNDLE_PATH):
+            # Exported serving bundle, no training structures are rebuilt
+            self.recommender = Recommender(self.DATA_PATH, redis_client=redis_client, bundle_path=self.BUNDLE_PATH,
+                                           quantize=quantize)
+            self.llm = LLM(api_key=api_key, recommender=self.recommender)
+        else:
+            self.recommender = Recommender(self.DATA_PATH, redis_client=redis_client, quantize=quantize,
+                                           encoder_path=self.MODEL_PATH)
+            self.llm = LLM(api_key=api_key, recommender=self.recommender)
+            self._load_model()
 
     def _load_model(self) -> None:
         lightgcn_model_path = os.path.join(self.MODEL_PATH, 'LightGCN_model.pth')
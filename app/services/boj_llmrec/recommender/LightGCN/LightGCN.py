@@ -1,11 +1,17 @@
 import torch
 import numpy as np
 from ..dataset import Dataset
+from ..utils import chunked_topk, csr_to_sparse_tensor
 
 class LightGCN(torch.nn.Module):
-    def __init__(self, dataset: Dataset) -> None:
+    def __init__(self, dataset: Dataset, n_layers: int = 1) -> None:
         super(LightGCN, self).__init__()
         self.dataset = dataset
+        self.n_layers = n_layers
+        # Propagated embeddings, only kept while the model is in eval mode
+        self._embedding_cache = None
+        # Layers 1..n_layers of the propagation, refreshed once per epoch in precomputed training
+        self._neighbour_embedding = None
 
         self.user_embedding = torch.nn.Embedding(
             self.dataset.user_cnt, 128
@@ -23,20 +29,56 @@ class LightGCN(torch.nn.Module):
         item_embedding = item_embedding[item_indices]
         return torch.sum(user_embedding * item_embedding, dim=1)
     
-    def get_topk(self, k: int) -> torch.Tensor:
+    def get_topk(self, k: int, chunk_size: int = 1024) -> torch.Tensor:
         user_embedding, item_embedding = self.get_embeddings()
-        scores = user_embedding @ item_embedding.T
-        trues = self.dataset.train_interactions.groupby('user_id')['item_id'].apply(list)
-        for user_id, items in trues.items():
-            scores[user_id, items] = -1e8
-        topk = torch.topk(scores, k=k, dim=1).indices
-        return topk
+
+        def score_fn(start: int, end: int) -> torch.Tensor:
+            return user_embedding[start:end] @ item_embedding.T
+
+        return chunked_topk(score_fn, self.dataset.user_item_matrix, k, chunk_size)
+
+    def train(self, mode: bool = True):
+        super(LightGCN, self).train(mode)
+        self.clear_embedding_cache()
+        return self
+
+    def load_state_dict(self, *args, **kwargs):
+        result = super(LightGCN, self).load_state_dict(*args, **kwargs)
+        self.clear_embedding_cache()
+        return result
+
+    def _save_to_state_dict(self, destination, prefix, keep_vars) -> None:
+        super(LightGCN, self)._save_to_state_dict(destination, prefix, keep_vars)
+        # Weights are trained for one propagation depth, so the depth is saved with them
+        destination[prefix + 'n_layers'] = torch.tensor(self.n_layers)
+
+    def _load_from_state_dict(self, state_dict, prefix, *args, **kwargs) -> None:
+        # Weights saved before the depth was stored keep the depth of the constructor
+        n_layers = state_dict.pop(prefix + 'n_layers', None)
+        if n_layers is not None and int(n_layers) != self.n_layers:
+            print(f'Using {int(n_layers)} propagation layers of the loaded weights instead of {self.n_layers}')
+            self.n_layers = int(n_layers)
+        super(LightGCN, self)._load_from_state_dict(state_dict, prefix, *args, **kwargs)
+
+    def clear_embedding_cache(self) -> None:
+        self._embedding_cache = None
+        self._neighbour_embedding = None
 
     def get_embeddings(self) -> tuple[torch.Tensor, torch.Tensor]:
+        if self.training:
+            return self.propagate()
+        # In-place parameter updates bump tensor versions, which also invalidates the cache
+        versions = (self.user_embedding.weight._version, self.item_embedding.weight._version)
+        if self._embedding_cache is None or self._embedding_cache[0] != versions:
+            with torch.no_grad():
+                self._embedding_cache = (versions, self.propagate())
+        return self._embedding_cache[1]
+
+    def propagate(self) -> tuple[torch.Tensor, torch.Tensor]:
         embeddings = []
         full_embedding = torch.cat([self.user_embedding.weight, self.item_embedding.weight], dim=0)
         embeddings.append(full_embedding)
-        for _ in range(1):
+        for _ in range(self.n_layers):
             full_embedding = torch.sparse.mm(self.aggregator, full_embedding)
             embeddings.append(full_embedding)
         final_embedding = torch.stack(embeddings, dim=0).mean(dim=0)
@@ -44,6 +86,103 @@ class LightGCN(torch.nn.Module):
             final_embedding, [self.dataset.user_cnt, self.dataset.item_cnt])
         return final_user_embedding, final_item_embedding
     
+    def forward_subgraph(self, user_indices: torch.Tensor, item_indices_list: list[torch.Tensor]) -> list[torch.Tensor]:
+        """Score users against each list of items, propagating only their k-hop neighbourhood."""
+        return self._score_nodes(user_indices, item_indices_list, self.get_subgraph_embeddings)
+
+    def forward_precomputed(self, user_indices: torch.Tensor, item_indices_list: list[torch.Tensor]) -> list[torch.Tensor]:
+        """Score users against each list of items from their own embeddings and the cached neighbour embeddings."""
+        return self._score_nodes(user_indices, item_indices_list, self.get_precomputed_embeddings)
+
+    def _score_nodes(self, user_indices: torch.Tensor, item_indices_list: list[torch.Tensor], embedding_fn) -> list[torch.Tensor]:
+        item_offset = self.dataset.user_cnt
+        nodes = torch.cat([user_indices, *[item_indices + item_offset for item_indices in item_indices_list]])
+        embedding = embedding_fn(nodes)
+        user_embedding, *item_embeddings = torch.split(
+            embedding, [len(user_indices)] + [len(item_indices) for item_indices in item_indices_list])
+        return [torch.sum(user_embedding * item_embedding, dim=1) for item_embedding in item_embeddings]
+
+    def get_subgraph_embeddings(self, nodes: torch.Tensor) -> torch.Tensor:
+        """Get final embeddings of the given nodes of the extended graph (users first, then items).
+
+        hops[j] holds the nodes within j hops of the targets. Layer l is only computed
+        on hops[n_layers - l], from the previous layer on hops[n_layers - l + 1].
+        """
+        graph = self.dataset.normalized_matrix.tocsr()
+        node_ids = nodes.to('cpu').numpy()
+        hops = [np.unique(node_ids)]
+        for _ in range(self.n_layers):
+            hops.append(np.union1d(hops[-1], graph[hops[-1]].indices))
+
+        device = self.user_embedding.weight.device
+        target_positions = [torch.from_numpy(np.searchsorted(hop, hops[0])).to(device) for hop in hops]
+        embedding = self.get_node_embeddings(hops[-1])
+        embeddings = [embedding[target_positions[-1]]]
+        for layer in range(1, self.n_layers + 1):
+            rows, cols = hops[self.n_layers - layer], hops[self.n_layers - layer + 1]
+            aggregator = csr_to_sparse_tensor(graph[rows][:, cols]).to(device)
+            embedding = torch.sparse.mm(aggregator, embedding)
+            embeddings.append(embedding[target_positions[self.n_layers - layer]])
+        final_embedding = torch.stack(embeddings, dim=0).mean(dim=0)
+        return final_embedding[torch.from_numpy(np.searchsorted(hops[0], node_ids)).to(device)]
+
+    def refresh_neighbour_embeddings(self) -> None:
+        """Cache the layers 1..n_layers of the propagation of the current embeddings, see get_precomputed_embeddings."""
+        with torch.no_grad():
+            embedding = torch.cat([self.user_embedding.weight, self.item_embedding.weight], dim=0)
+            total = torch.zeros_like(embedding)
+            for _ in range(self.n_layers):
+                embedding = torch.sparse.mm(self.aggregator, embedding)
+                total += embedding
+            self._neighbour_embedding = total / (self.n_layers + 1)
+
+    def get_precomputed_embeddings(self, nodes: torch.Tensor) -> torch.Tensor:
+        """Get final embeddings of the given nodes of the extended graph (users first, then items).
+
+        Final embeddings are mean(E, A E, ..., A^n_layers E), of which only E is live:
+        the other layers come from refresh_neighbour_embeddings, computed once per epoch without gradients,
+        as SGC precomputes smoothed features. So a batch costs lookups only, at any depth,
+        but neighbour layers lag behind the updates of the epoch and no gradient flows through them,
+        embeddings being trained towards their neighbours' as of the start of the epoch.
+        """
+        if self._neighbour_embedding is None:
+            self.refresh_neighbour_embeddings()
+        user_cnt = self.dataset.user_cnt
+        is_user = nodes < user_cnt
+        embedding = torch.where(is_user[:, None],
+                                self.user_embedding(torch.where(is_user, nodes, 0)),
+                                self.item_embedding(torch.where(is_user, 0, nodes - user_cnt)))
+        return embedding / (self.n_layers + 1) + self._neighbour_embedding[nodes]
+
+    def get_node_embeddings(self, node_ids: np.ndarray) -> torch.Tensor:
+        # Node ids are sorted, so user rows come before item rows
+        device = self.user_embedding.weight.device
+        is_user = node_ids < self.dataset.user_cnt
+        user_ids = torch.from_numpy(node_ids[is_user]).to(device)
+        item_ids = torch.from_numpy(node_ids[~is_user] - self.dataset.user_cnt).to(device)
+        return torch.cat([self.user_embedding(user_ids), self.item_embedding(item_ids)], dim=0)
+
+    def fold_in(self, dataset: Dataset) -> None:
+        """Grow the model to a dataset with appended interactions, without retraining.
+
+        Base embeddings of new users are one propagation step from the base embeddings of their items,
+        trained embeddings are kept, and propagated embeddings are refreshed over the new graph on next use.
+        Parameters are replaced, so optimizers built before the fold-in must be rebuilt.
+        """
+        if dataset.item_cnt != self.dataset.item_cnt:
+            raise ValueError("Folding in new items is not supported.")
+        old_user_cnt = self.dataset.user_cnt
+        device = self.user_embedding.weight.device
+        # Rows of new users over item columns of the normalized extended matrix
+        user_item = dataset.normalized_matrix.tocsr()[old_user_cnt:dataset.user_cnt, dataset.user_cnt:]
+        with torch.no_grad():
+            new_user_weight = torch.sparse.mm(csr_to_sparse_tensor(user_item).to(device), self.item_embedding.weight)
+            weight = torch.cat([self.user_embedding.weight, new_user_weight], dim=0)
+        self.user_embedding = torch.nn.Embedding.from_pretrained(weight, freeze=False)
+        self.dataset = dataset
+        self.aggregator = self.get_aggregator().to(device)
+        self.clear_embedding_cache()
+
     def get_aggregator(self) -> torch.Tensor:
         coo = self.dataset.normalized_matrix.tocoo()
         indices = torch.tensor(np.array([coo.row, coo.col]), dtype=torch.long)
@@ -53,6 +192,7 @@ class LightGCN(torch.nn.Module):
     
     def to(self, device: torch.device):
         super(LightGCN, self).to(device)
+        self.clear_embedding_cache()
         self.aggregator = self.aggregator.to(device)
         self.user_embedding = self.user_embedding.to(device)
         self.item_embedding = self.item_embedding.to(device)
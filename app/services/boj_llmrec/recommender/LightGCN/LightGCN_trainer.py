@@ -1,56 +1,103 @@
+import time
 import torch
 from tqdm import tqdm
 from ..dataset import Dataset
 from .LightGCN import LightGCN
-from ..utils import bpr_loss, recall
+from ..utils import bpr_loss
 from ..sampler import NegativeSampler
+from ..evaluation import evaluate, truth_matrix
 
 class LightGCNTrainer:
 
-    def __init__(self, dataset: Dataset, model: LightGCN) -> None:
+    # Epochs between validations
+    validate_every = 1
+
+    def __init__(self, dataset: Dataset, model: LightGCN, mode: str = 'full', lr: float = 0.001,
+                 seed: int = None) -> None:
+        """
+        mode: 'full' propagates the whole graph for every batch,
+        'subgraph' only propagates the k-hop neighbourhood of the batch,
+        'precomputed' propagates the whole graph once per epoch without gradients and only trains
+        the batch's own embeddings against it, see LightGCN.get_precomputed_embeddings.
+        seed: seed of the negative sampler, batches are shuffled by torch's global generator.
+        """
+        if mode not in ('full', 'subgraph', 'precomputed'):
+            raise ValueError(f"Invalid mode: {mode}. Must be 'full', 'subgraph' or 'precomputed'.")
         self.dataset = dataset
         self.model = model
+        self.mode = mode
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.optimizer = torch.optim.Adam(self.model.parameters(), lr=lr)
+        self.sampler = NegativeSampler(self.dataset, 100, 1, seed=seed)
+        self._next_samples = None
         if self.dataset.test_interactions is not None:
-            grouped = self.dataset.test_interactions.groupby('user_id')['item_id'].apply(list)
-            self.all_true = [grouped.get(user_id, []) for user_id in range(self.dataset.user_cnt)]
-           
-    def train(self):
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        print(f'device: {device}')
-        optimizer = torch.optim.Adam(self.model.parameters(), lr=0.001)
-        sampler = NegativeSampler(self.dataset, 100, 1)
-        
-        self.model.to(device)
-        for epoch in range(10):
-            total_loss = 0
-            pairwise_samples = sampler.get_samples().to(device)
-            dataset = torch.utils.data.TensorDataset(*pairwise_samples.T)
-            dataloader = torch.utils.data.DataLoader(
-                dataset=dataset,
-                batch_size=512,
-                shuffle=True,
-            )
-            for users, pos_samples, *neg_samples_list in tqdm(dataloader):
-                optimizer.zero_grad()
+            self.truth = truth_matrix(self.dataset.test_interactions, self.dataset.user_cnt)
+
+    def train(self, epochs: int = 10) -> None:
+        print(f'device: {self.device}')
+        for epoch in range(epochs):
+            self.train_epoch(epoch, has_next=epoch + 1 < epochs)
+            if (self.dataset.test_interactions is not None and
+                epoch % self.validate_every == 0):
+                self.validate()
+
+    def train_epoch(self, epoch: int, has_next: bool = True) -> float:
+        """Train one epoch and get its average loss.
+
+        Samples of the next epoch are drawn in the background only if has_next.
+        """
+        self.model.to(self.device)
+        self.model.train()
+        if self.mode == 'precomputed':
+            self.model.refresh_neighbour_embeddings()
+        if self._next_samples is None:
+            self._next_samples = self.sampler.get_samples_async()
+        total_loss = 0
+        pairwise_samples = self._next_samples.result().to(self.device)
+        # Samples of the next epoch are drawn while this one trains
+        self._next_samples = self.sampler.get_samples_async() if has_next else None
+        dataset = torch.utils.data.TensorDataset(*pairwise_samples.T)
+        dataloader = torch.utils.data.DataLoader(
+            dataset=dataset,
+            batch_size=512,
+            shuffle=True,
+        )
+        for users, pos_samples, *neg_samples_list in tqdm(dataloader):
+            self.optimizer.zero_grad()
+            if self.mode == 'subgraph':
+                pos_scores, *neg_scores_list = self.model.forward_subgraph(users, [pos_samples, *neg_samples_list])
+            elif self.mode == 'precomputed':
+                pos_scores, *neg_scores_list = self.model.forward_precomputed(users, [pos_samples, *neg_samples_list])
+            else:
                 pos_scores = self.model(users, pos_samples)
                 neg_scores_list = []
                 for neg_samples in neg_samples_list:
                     neg_scores_list.append(self.model(users, neg_samples))
-                loss = bpr_loss(pos_scores, *neg_scores_list)
-                loss.backward()
-                optimizer.step() 
-                total_loss += loss.item()
-                
-            print(f'avg_loss: {total_loss / len(dataloader)}')
-            if (self.dataset.test_interactions is not None and 
-                epoch % 1 == 0):
-                self.validate()
+            loss = bpr_loss(pos_scores, *neg_scores_list)
+            loss.backward()
+            self.optimizer.step()
+            total_loss += loss.item()
+
+        avg_loss = total_loss / len(dataloader)
+        print(f'avg_loss: {avg_loss}')
+        return avg_loss
+
+    def cancel_prefetch(self) -> None:
+        """Drop the samples drawn for an epoch that will not be trained, e.g. after early stopping."""
+        if self._next_samples is not None:
+            self._next_samples.cancel()
+            self._next_samples = None
 
-    def validate(self):
+    def validate(self) -> dict:
         if self.dataset.test_interactions is None:
             return
         self.model.eval()
+        start = time.perf_counter()
         with torch.no_grad():
-            pred = self.model.get_topk(10).to('cpu').numpy().tolist()
+            pred = self.model.get_topk(10).to('cpu').numpy()
+        topk_sec = time.perf_counter() - start
         self.model.train()
-        print(recall(self.all_true, pred))
+        result = evaluate(pred, self.truth, k=10, item_cnt=self.dataset.item_cnt)
+        result['topk_sec'] = topk_sec
+        print(result)
+        return result
@@ -0,0 +1,50 @@
+import time
+import pandas as pd
+import torch
+
+from ..dataset import Dataset
+from ..encoder import Encoder
+from ..splitter import Splitter
+from .LightGCN import LightGCN
+from .LightGCN_trainer import LightGCNTrainer
+
+def benchmark_training_modes(interactions: pd.DataFrame, modes: tuple[str] = ('full', 'subgraph', 'precomputed'),
+                             n_layers: int = 1, epochs: int = 10, seed: int = 0) -> dict:
+    """Train LightGCN once per training mode on the same split, and compare training time and recall.
+
+    Only epochs are timed, validation costs the same in every mode and is run once at the end.
+
+    Parameters
+    ----------
+    interactions : pd.DataFrame
+        Raw interactions with 'user_id' and 'item_id' columns
+    modes : tuple[str]
+        Training modes of LightGCNTrainer to compare
+    n_layers : int
+        Number of propagation layers
+    epochs : int
+        Number of epochs per run
+    seed : int
+        Seed of the split, the model initialization, batch shuffling and negative sampling, shared by every run
+
+    Returns
+    -------
+    dict
+        {mode: {'sec': training seconds, **final validation metrics}, ...}
+    """
+    train, test = Splitter().leave_n_out_split(interactions, n=20, seed=seed)
+    # Users without enough interactions are dropped by the split, so ids are encoded again
+    encoder = Encoder().fit(train)
+    dataset = Dataset(encoder.transform(train), encoder.transform(test), None, None)
+
+    results = {}
+    for mode in modes:
+        torch.manual_seed(seed)
+        model = LightGCN(dataset, n_layers=n_layers)
+        trainer = LightGCNTrainer(dataset, model, mode=mode, seed=seed)
+        start = time.perf_counter()
+        for epoch in range(epochs):
+            trainer.train_epoch(epoch, has_next=epoch + 1 < epochs)
+        elapsed = time.perf_counter() - start
+        results[mode] = {'sec': elapsed, **trainer.validate()}
+    return results
@@ -1,49 +1,72 @@
+import time
 import torch
 from ..dataset import Dataset
 from .MultiVAE import MultiVAE
-from ..utils import vae_reg_loss, vae_bce_loss, recall
+from ..utils import vae_reg_loss, vae_bce_loss
+from ..batching import csr_row_loader
+from ..evaluation import evaluate, truth_matrix
 
 class MultiVAETrainer:
-    def __init__(self, dataset: Dataset, model: MultiVAE) -> None:
+    # Epochs between validations
+    validate_every = 5
+
+    def __init__(self, dataset: Dataset, model: MultiVAE, num_workers: int = 0, lr: float = 0.0005) -> None:
+        """
+        num_workers: DataLoader worker processes densifying the user batches.
+        """
         self.dataset = dataset
         self.model = model
+        self.num_workers = num_workers
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.optimizer = torch.optim.Adam(self.model.parameters(), lr=lr)
+        self._dataloader = None
         if self.dataset.test_interactions is not None:
-            grouped = self.dataset.test_interactions.groupby('user_id')['item_id'].apply(list)
-            self.all_true = [grouped.get(user_id, []) for user_id in range(self.dataset.user_cnt)]
-
-    def train(self):
-        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        optimizer = torch.optim.Adam(self.model.parameters(), lr=0.0005)
-        user_info = torch.tensor(self.dataset.user_item_matrix.todense()).to(device)
-        dataset = torch.utils.data.TensorDataset(user_info)
-        dataloader = torch.utils.data.DataLoader(
-            dataset=dataset,
-            batch_size=512,
-            shuffle=True,
-        )
-        self.model.to(device)
-
-        for epoch in range(60):
-            for (batch_user_info, ) in dataloader:
-                optimizer.zero_grad()
-                batch_user_info = batch_user_info.to(device).to(torch.float32)
-
-                recon_users, mu, log_var = self.model(batch_user_info)
-                reg_loss = vae_reg_loss(mu, log_var)
-                bce_loss = vae_bce_loss(batch_user_info, recon_users)
-                loss = (bce_loss + 0.05 * reg_loss).mean()
-                loss.backward()
-                optimizer.step()
-
-            print(f'epoch: {epoch}')
-            if epoch % 5 == 0 and self.dataset.test_interactions is not None:
+            self.truth = truth_matrix(self.dataset.test_interactions, self.dataset.user_cnt)
+
+    def train(self, epochs: int = 60) -> None:
+        for epoch in range(epochs):
+            self.train_epoch(epoch)
+            if epoch % self.validate_every == 0 and self.dataset.test_interactions is not None:
                 self.validate()
 
-    def validate(self):
+    def train_epoch(self, epoch: int, has_next: bool = True) -> float:
+        """Train one epoch and get its average loss.
+
+        has_next is only part of the trainer interface of TrainingRunner, nothing is prefetched across epochs.
+        """
+        if self._dataloader is None:
+            # Only the current batch of users is densified
+            self._dataloader = csr_row_loader(self.dataset.user_item_matrix, batch_size=512,
+                                              shuffle=True, num_workers=self.num_workers)
+        self.model.to(self.device)
+        self.model.train()
+
+        total_loss = 0
+        for batch_user_info in self._dataloader:
+            self.optimizer.zero_grad()
+            batch_user_info = batch_user_info.to(self.device, non_blocking=True)
+
+            recon_users, mu, log_var = self.model(batch_user_info)
+            reg_loss = vae_reg_loss(mu, log_var)
+            bce_loss = vae_bce_loss(batch_user_info, recon_users)
+            loss = (bce_loss + 0.05 * reg_loss).mean()
+            loss.backward()
+            self.optimizer.step()
+            total_loss += loss.item()
+
+        print(f'epoch: {epoch}')
+        return total_loss / len(self._dataloader)
+
+    def validate(self) -> dict:
         if self.dataset.test_interactions is None:
             return
         self.model.eval()
+        start = time.perf_counter()
         with torch.no_grad():
-            pred = self.model.get_topk(10).to('cpu').numpy().tolist()
+            pred = self.model.get_topk(10).to('cpu').numpy()
+        topk_sec = time.perf_counter() - start
         self.model.train()
-        print(recall(self.all_true, pred))
+        result = evaluate(pred, self.truth, k=10, item_cnt=self.dataset.item_cnt)
+        result['topk_sec'] = topk_sec
+        print(result)
+        return result
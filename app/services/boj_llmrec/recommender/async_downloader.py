@@ -0,0 +1,375 @@
+import time
+import random
+import asyncio
+import threading
+import datetime as dt
+import email.utils
+import httpx
+from typing import Awaitable, Callable, Hashable
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from .downloader import DataDownloader
+
+class TokenBucket:
+    """
+    Asyncio token bucket shared by every call of a client.
+
+    Tokens refill continuously at `rate` per second up to `capacity`,
+    so short bursts go out at once and sustained traffic is paced at `rate`.
+    """
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+        self._lock = None
+
+    async def acquire(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class AsyncDataDownloader:
+    """
+    Asyncio solved.ac client for the endpoints of DataDownloader.
+
+    Connections are kept alive and shared by every call, calls are paced by a token bucket,
+    and 429, 5xx and transport errors are retried with exponential backoff honoring Retry-After.
+    Every request is bounded by deadline_sec overall, rate limiting, attempts and backoffs included,
+    after which httpx.TimeoutException is raised, and a backoff that would overrun it is not waited.
+    """
+
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url: str = DataDownloader.URL, rate_per_sec: float = 1., burst: int = 5,
+                 max_retries: int = 3, timeout_sec: float = 5., backoff_base_sec: float = .5,
+                 max_backoff_sec: float = 60., max_connections: int = 10, deadline_sec: float = 120.) -> None:
+        """Initialize downloader.
+
+        Parameters
+        ----------
+        base_url : str
+            API url, e.g. a local stand-in server in tests
+        rate_per_sec : float
+            Sustained calls per second
+        burst : int
+            Calls allowed at once after idling
+        max_retries : int
+            Retries after the first attempt
+        timeout_sec : float
+            Timeout of each attempt
+        backoff_base_sec : float
+            Backoff before the first retry, doubled on every retry
+        max_backoff_sec : float
+            Upper bound of a backoff, Retry-After included
+        max_connections : int
+            Size of the keep-alive connection pool
+        deadline_sec : float
+            Total time of a request, retries included
+        """
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.timeout_sec = timeout_sec
+        self.backoff_base_sec = backoff_base_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.max_connections = max_connections
+        self.deadline_sec = deadline_sec
+        self.limiter = TokenBucket(rate_per_sec, burst)
+        self._client = None
+
+        # Same limits as DataDownloader
+        self._max_page = 100
+        self._max_problems = 100
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created on first use, so it belongs to the event loop running the calls
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout_sec,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def __aenter__(self) -> 'AsyncDataDownloader':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    def _backoff_sec(self, attempt: int, response: httpx.Response = None) -> float:
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after is not None:
+            # Either delay seconds or an HTTP date
+            try:
+                return min(max(float(retry_after), 0.), self.max_backoff_sec)
+            except ValueError:
+                pass
+            try:
+                retry_at = email.utils.parsedate_to_datetime(retry_after)
+                seconds = (retry_at - dt.datetime.now(dt.timezone.utc)).total_seconds()
+                return min(max(seconds, 0.), self.max_backoff_sec)
+            except (TypeError, ValueError):
+                pass
+        # Full jitter, so workers rejected together do not retry together
+        return random.uniform(0, min(self.backoff_base_sec * 2 ** attempt, self.max_backoff_sec))
+
+    async def _get(self, endpoint: str, params: dict) -> httpx.Response:
+        """GET the endpoint within deadline_sec, retrying rate limits, server errors and transport errors.
+
+        Returns
+        -------
+        httpx.Response
+            Successful response.
+        """
+        try:
+            return await asyncio.wait_for(self._get_with_retries(endpoint, params), self.deadline_sec)
+        except asyncio.TimeoutError:
+            raise httpx.TimeoutException(f'GET {endpoint} did not succeed within {self.deadline_sec}s') from None
+
+    async def _get_with_retries(self, endpoint: str, params: dict) -> httpx.Response:
+        deadline = time.monotonic() + self.deadline_sec
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire()
+            response = None
+            try:
+                response = await self.client.get(endpoint, params=params)
+                response.raise_for_status()
+                return response
+            except httpx.HTTPStatusError as e:
+                if response.status_code not in AsyncDataDownloader.RETRY_STATUS_CODES or attempt == self.max_retries:
+                    raise
+                error = e
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise
+                error = e
+            backoff_sec = self._backoff_sec(attempt, response)
+            # Failing now beats waiting for a retry the deadline would cut off anyway
+            if time.monotonic() + backoff_sec >= deadline:
+                raise error
+            await asyncio.sleep(backoff_sec)
+
+    async def _get_pages(self, endpoint: str, params: dict) -> list[dict]:
+        items = []
+        for cur_page in range(1, self._max_page + 1):
+            response = await self._get(endpoint, {**params, 'page': cur_page})
+            if not response.json()['items']:
+                break
+            items += response.json()['items']
+        else:
+            raise Exception('Max page reached!')
+        return items
+
+    async def get_universities(self) -> list[dict]:
+        """Get info about universities, see DataDownloader.get_universities."""
+        return await self._get_pages('/v3/ranking/organization', {'type': 'university'})
+
+    async def get_students(self, univ_id: int) -> list[dict]:
+        """Get all info about students at the university, see DataDownloader.get_students."""
+        return await self._get_pages('/v3/ranking/in_organization', {'organizationId': univ_id})
+
+    async def get_top_100_problems(self, handle: str) -> list[dict]:
+        """Get info about top 100 problems solved by the handle, see DataDownloader.get_top_100_problems."""
+        params = {'handle': handle, 'x-solvedac-language': 'ko'}
+        response = await self._get('/v3/user/top_100', params)
+        return response.json()['items']
+
+    async def get_problem(self, problem_id: int) -> dict:
+        """Get problem info of the problem id, see DataDownloader.get_problem."""
+        response = await self._get('/v3/problem/show', {'problemId': problem_id})
+        return response.json()
+
+    async def get_problems(self, problem_ids: list[int]) -> list[dict]:
+        """Get problem info of at most 100 problem ids, see DataDownloader.get_problems."""
+        if len(problem_ids) > self._max_problems:
+            raise Exception(f'Too many problems! - cur: {len(problem_ids)} > max: {self._max_problems}')
+        params = {'problemIds': ','.join(str(id) for id in problem_ids)}
+        response = await self._get('/v3/problem/lookup', params)
+        return response.json()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one in-flight call.
+
+    Callers arriving while a call is in flight await its result instead of calling again,
+    so they share the returned object and must not mutate it.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, coroutine_fn: Callable[[], Awaitable]):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coroutine_fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._calls.pop(key) if self._calls.get(key) is done else None)
+        # Shielded, so a cancelled caller does not cancel the call of the others
+        return await asyncio.shield(task)
+
+class ProblemLookupBatcher:
+    """
+    Batches problem lookups of concurrent callers into shared lookups of at most `max_batch` ids.
+
+    Requested ids wait at most `window_sec` for other callers, a full batch is sent right away,
+    and an id requested by several callers is looked up once.
+    """
+
+    def __init__(self, lookup_fn: Callable[[list[int]], Awaitable[list[dict]]], max_batch: int = 100,
+                 window_sec: float = .01) -> None:
+        self.lookup_fn = lookup_fn
+        self.max_batch = max_batch
+        self.window_sec = window_sec
+        self._pending: dict[int, asyncio.Future] = {}
+        self._flush_handle = None
+
+    async def get(self, problem_ids: list[int]) -> list[dict]:
+        """Get problem info of the problem ids, unknown problems being left out as in /v3/problem/lookup."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for problem_id in dict.fromkeys(problem_ids):
+            future = self._pending.get(problem_id)
+            if future is None:
+                future = loop.create_future()
+                self._pending[problem_id] = future
+                if len(self._pending) >= self.max_batch:
+                    self._flush()
+            futures.append(future)
+        if self._pending and self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_sec, self._flush)
+        problems = await asyncio.gather(*[asyncio.shield(future) for future in futures])
+        return [problem for problem in problems if problem is not None]
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            asyncio.ensure_future(self._lookup(batch))
+
+    async def _lookup(self, batch: dict[int, asyncio.Future]) -> None:
+        try:
+            problems = await self.lookup_fn(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        problems = {problem['problemId']: problem for problem in problems}
+        for problem_id, future in batch.items():
+            if not future.done():
+                future.set_result(problems.get(problem_id))
+
+class CoalescingDataDownloader:
+    """
+    AsyncDataDownloader wrapper cutting duplicate outbound requests.
+
+    Concurrent calls with the same arguments share one request, and problem lookups
+    from different callers are batched into shared 100-id /v3/problem/lookup calls,
+    so callers may request any number of problems.
+    """
+
+    def __init__(self, downloader: AsyncDataDownloader = None, batch_window_sec: float = .01) -> None:
+        self.downloader = downloader or AsyncDataDownloader()
+        self._single_flight = SingleFlight()
+        self._problem_batcher = ProblemLookupBatcher(
+            self.downloader.get_problems, self.downloader._max_problems, batch_window_sec)
+
+    async def get_universities(self) -> list[dict]:
+        return await self._single_flight.do(('universities',), self.downloader.get_universities)
+
+    async def get_students(self, univ_id: int) -> list[dict]:
+        return await self._single_flight.do(('students', univ_id), lambda: self.downloader.get_students(univ_id))
+
+    async def get_top_100_problems(self, handle: str) -> list[dict]:
+        return await self._single_flight.do(('top_100', handle), lambda: self.downloader.get_top_100_problems(handle))
+
+    async def get_problem(self, problem_id: int) -> dict:
+        return await self._single_flight.do(('problem', problem_id), lambda: self.downloader.get_problem(problem_id))
+
+    async def get_problems(self, problem_ids: list[int]) -> list[dict]:
+        return await self._problem_batcher.get(problem_ids)
+
+    async def aclose(self) -> None:
+        await self.downloader.aclose()
+
+class ThreadedDataDownloader:
+    """
+    Blocking facade of an AsyncDataDownloader running on its own event loop thread.
+
+    Synchronous code, e.g. chat turns running in the threadpool, shares one client,
+    hence one connection pool and one rate limiter, without stalling the server's event loop.
+    Coroutines can also be awaited from another loop through `submit` and `asyncio.wrap_future`.
+    """
+
+    def __init__(self, downloader: AsyncDataDownloader | CoalescingDataDownloader = None,
+                 timeout_sec: float = 15.) -> None:
+        """
+        downloader defaults to a coalescing client for interactive use: Retry-After is capped at 5 seconds
+        and every request gives up after 10 seconds.
+        timeout_sec bounds how long a call blocks, paged calls being bounded per page by the downloader only.
+        """
+        # Requests from every thread meet on one loop, so they are coalesced across threads too
+        self.downloader = downloader or CoalescingDataDownloader(AsyncDataDownloader(max_backoff_sec=5., deadline_sec=10.))
+        self.timeout_sec = timeout_sec
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='solvedac-client', daemon=True).start()
+            return self._loop
+
+    def submit(self, coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def _call(self, coroutine, timeout_sec: float = None):
+        future = self.submit(coroutine)
+        try:
+            return future.result(timeout=timeout_sec)
+        except FutureTimeoutError:
+            # Cancels the coroutine on the loop as well
+            future.cancel()
+            raise httpx.TimeoutException(f'solved.ac call did not finish within {timeout_sec}s') from None
+
+    def get_universities(self) -> list[dict]:
+        return self._call(self.downloader.get_universities())
+
+    def get_students(self, univ_id: int) -> list[dict]:
+        return self._call(self.downloader.get_students(univ_id))
+
+    def get_top_100_problems(self, handle: str) -> list[dict]:
+        return self._call(self.downloader.get_top_100_problems(handle), self.timeout_sec)
+
+    def get_problem(self, problem_id: int) -> dict:
+        return self._call(self.downloader.get_problem(problem_id), self.timeout_sec)
+
+    def get_problems(self, problem_ids: list[int]) -> list[dict]:
+        return self._call(self.downloader.get_problems(problem_ids), self.timeout_sec)
+
+    def close(self) -> None:
+        if self._loop is not None:
+            self._call(self.downloader.aclose())
+            self._loop.call_soon_threadsafe(self._loop.stop)
@@ -0,0 +1,44 @@
+import numpy as np
+import torch
+from scipy.sparse import csr_matrix
+
+class CSRRowCollator:
+    """
+    Collate function densifying only the sampled rows of a CSR matrix.
+
+    Used with a DataLoader over row indices, so a training batch costs
+    O(batch size × columns) memory instead of densifying the whole matrix.
+    It is picklable, so batches can also be densified in DataLoader workers.
+    """
+
+    def __init__(self, matrix: csr_matrix) -> None:
+        self.matrix = matrix.tocsr()
+
+    def __call__(self, rows: list[int]) -> torch.Tensor:
+        batch = self.matrix[np.asarray(rows)]
+        return torch.from_numpy(batch.toarray().astype(np.float32))
+
+def csr_row_loader(matrix: csr_matrix, batch_size: int = 512, shuffle: bool = True,
+                   num_workers: int = 0) -> torch.utils.data.DataLoader:
+    """Get a DataLoader of dense float32 row batches of a CSR matrix.
+
+    Parameters
+    ----------
+    matrix : csr_matrix
+        Matrix whose rows are the samples, e.g. the user-item matrix
+    batch_size : int
+        Number of rows per batch
+    shuffle : bool
+        Whether rows are reshuffled every epoch
+    num_workers : int
+        Number of DataLoader worker processes densifying batches, 0 densifies in the main process
+    """
+    return torch.utils.data.DataLoader(
+        dataset=range(matrix.shape[0]),
+        batch_size=batch_size,
+        shuffle=shuffle,
+        collate_fn=CSRRowCollator(matrix),
+        num_workers=num_workers,
+        pin_memory=torch.cuda.is_available(),
+        persistent_workers=num_workers > 0,
+    )
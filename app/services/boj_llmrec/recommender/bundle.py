@@ -0,0 +1,104 @@
+import os
+import glob
+import json
+import shutil
+import tempfile
+import uuid
+import numpy as np
+import pandas as pd
+import torch
+
+from .encoder import Encoder
+
+class ServingBundle:
+    """
+    Self-contained artifact with everything the API needs for inference.
+
+    Holds encoder vocabularies, MultiVAE weights, propagated LightGCN item embeddings
+    and the problem catalogue, so serving never reads the interaction csv
+    nor rebuilds the training graph.
+    """
+
+    META_FILE = 'meta.json'
+    MULTIVAE_FILE = 'MultiVAE_model.pth'
+    EMBEDDING_FILE = 'lightgcn_embeddings.npz'
+    PROBLEM_FILE = 'problem_info.npz'
+
+    def __init__(self, version: str, encoder: Encoder, multivae_state_dict: dict,
+                 item_embedding: np.ndarray, problem_info: pd.DataFrame, item_rows: np.ndarray,
+                 lightgcn_layers: int = 1) -> None:
+        self.version = version
+        self.encoder = encoder
+        self.multivae_state_dict = multivae_state_dict
+        self.item_embedding = item_embedding
+        self.problem_info = problem_info
+        self.item_rows = item_rows
+        self.lightgcn_layers = lightgcn_layers
+
+    @staticmethod
+    def make_version_dir(bundle_path: str, version: str) -> str:
+        """Get a new empty directory next to bundle_path for a bundle to be published there."""
+        parent, name = os.path.split(os.path.normpath(bundle_path))
+        os.makedirs(parent or '.', exist_ok=True)
+        version_path = tempfile.mkdtemp(dir=parent or '.', prefix=f'{name}-{version}-')
+        # Readable by workers of other users, as a regular directory would be
+        os.chmod(version_path, 0o755)
+        return version_path
+
+    @staticmethod
+    def publish(version_path: str, bundle_path: str, keep: int = 2) -> None:
+        """Atomically point the bundle_path symlink at a complete bundle directory.
+
+        Workers resolve the link once when loading, so they keep the directory they loaded from.
+        Only the `keep` latest directories are kept, so workers still loading the previous bundle finish.
+        """
+        bundle_path = os.path.normpath(bundle_path)
+        if os.path.isdir(bundle_path) and not os.path.islink(bundle_path):
+            # Bundles used to be exported into bundle_path itself
+            os.rename(bundle_path, f'{bundle_path}-legacy-{uuid.uuid4().hex[:8]}')
+        link_path = f'{bundle_path}.{uuid.uuid4().hex[:8]}.tmp'
+        os.symlink(os.path.basename(version_path), link_path)
+        os.replace(link_path, bundle_path)
+
+        version_paths = [path for path in glob.glob(f'{bundle_path}-*')
+                         if os.path.isdir(path) and not os.path.islink(path)]
+        version_paths.sort(key=os.path.getmtime, reverse=True)
+        current = os.path.realpath(bundle_path)
+        for path in version_paths[keep:]:
+            if os.path.realpath(path) != current:
+                shutil.rmtree(path, ignore_errors=True)
+
+    @staticmethod
+    def exists(bundle_path: str) -> bool:
+        return os.path.exists(os.path.join(bundle_path, ServingBundle.META_FILE))
+
+    def save(self, bundle_path: str) -> None:
+        os.makedirs(bundle_path, exist_ok=True)
+        self.encoder.save(bundle_path)
+        torch.save(self.multivae_state_dict, os.path.join(bundle_path, ServingBundle.MULTIVAE_FILE))
+        np.savez(os.path.join(bundle_path, ServingBundle.EMBEDDING_FILE),
+                 item=self.item_embedding)
+        # Object columns are stored as fixed-width strings so that loading never needs pickle
+        columns = {
+            column: values.fillna('').astype(str).values if values.dtype == object else values.values
+            for column, values in self.problem_info.items()
+        }
+        np.savez(os.path.join(bundle_path, ServingBundle.PROBLEM_FILE), item_rows=self.item_rows, **columns)
+        # Meta is written last, a bundle without it is incomplete
+        with open(os.path.join(bundle_path, ServingBundle.META_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'version': self.version, 'columns': list(columns), 'lightgcn_layers': self.lightgcn_layers}, f)
+
+    @classmethod
+    def load(cls, bundle_path: str) -> 'ServingBundle':
+        with open(os.path.join(bundle_path, ServingBundle.META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        encoder = Encoder.load(bundle_path)
+        multivae_state_dict = torch.load(os.path.join(bundle_path, ServingBundle.MULTIVAE_FILE),
+                                         weights_only=True, map_location=torch.device('cpu'))
+        with np.load(os.path.join(bundle_path, ServingBundle.EMBEDDING_FILE)) as embedding:
+            item_embedding = embedding['item']
+        with np.load(os.path.join(bundle_path, ServingBundle.PROBLEM_FILE)) as problems:
+            item_rows = problems['item_rows']
+            problem_info = pd.DataFrame({column: problems[column] for column in meta['columns']})
+        return cls(meta['version'], encoder, multivae_state_dict,
+                   item_embedding, problem_info, item_rows, meta.get('lightgcn_layers', 1))
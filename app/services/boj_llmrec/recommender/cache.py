@@ -0,0 +1,233 @@
+import time
+import json
+import hashlib
+import threading
+import httpx
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+class RecommendationCache:
+    """
+    Two-tier cache of per-handle recommendations.
+
+    The first tier is an in-process LRU, the second one is an optional shared redis
+    (any client exposing `get` and `setex`). Only the top-K encoded item ids are stored,
+    keyed on handle, solved-set hash and the version of the loaded model.
+    """
+
+    PREFIX = 'boj_llmrec:rec'
+
+    def __init__(self, redis_client=None, max_size: int = 1024, local_ttl_sec: int = 300, redis_ttl_sec: int = 3600) -> None:
+        """Initialize cache.
+
+        Parameters
+        ----------
+        redis_client : redis.Redis, optional
+            Synchronous redis client (with decode_responses=False) used as shared tier
+        max_size : int
+            Max number of entries kept in the in-process LRU
+        local_ttl_sec : int
+            Expiration seconds of in-process entries
+        redis_ttl_sec : int
+            Expiration seconds of redis entries
+        """
+        self.redis_client = redis_client
+        self.max_size = max_size
+        self.local_ttl_sec = local_ttl_sec
+        self.redis_ttl_sec = redis_ttl_sec
+        self.model_version = ''
+        self._local: OrderedDict[str, tuple[float, np.ndarray]] = OrderedDict()
+        # Chat turns run on a threadpool, so the LRU is shared between threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def solved_hash(solved_ids: np.ndarray) -> str:
+        solved_ids = np.unique(np.asarray(solved_ids, dtype=np.int64))
+        return hashlib.sha1(solved_ids.tobytes()).hexdigest()[:16]
+
+    def key(self, handle: str, solved_ids: np.ndarray) -> str:
+        return f'{RecommendationCache.PREFIX}:{self.model_version}:{handle}:{self.solved_hash(solved_ids)}'
+
+    def set_model_version(self, model_version: str) -> None:
+        """Switch to a new model version.
+
+        Local entries are dropped right away. Redis entries of older versions
+        can no longer be reached and simply expire.
+        """
+        if model_version != self.model_version:
+            self.model_version = model_version
+            with self._lock:
+                self._local.clear()
+
+    def get(self, key: str) -> np.ndarray | None:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                expire_at, item_ids = entry
+                if expire_at > time.monotonic():
+                    self._local.move_to_end(key)
+                    return item_ids
+                del self._local[key]
+
+        if self.redis_client is None:
+            return None
+        try:
+            payload = self.redis_client.get(key)
+        except Exception as e:
+            print(f"[RecommendationCache] Failed to read {key} from redis: {e}")
+            return None
+        if payload is None:
+            return None
+        item_ids = np.frombuffer(payload, dtype=np.int32)
+        self._set_local(key, item_ids)
+        return item_ids
+
+    def set(self, key: str, item_ids: np.ndarray) -> None:
+        item_ids = np.ascontiguousarray(item_ids, dtype=np.int32)
+        self._set_local(key, item_ids)
+        if self.redis_client is None:
+            return
+        try:
+            self.redis_client.setex(key, self.redis_ttl_sec, item_ids.tobytes())
+        except Exception as e:
+            print(f"[RecommendationCache] Failed to write {key} to redis: {e}")
+
+    def _set_local(self, key: str, item_ids: np.ndarray) -> None:
+        with self._lock:
+            self._local[key] = (time.monotonic() + self.local_ttl_sec, item_ids)
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+class Top100Cache:
+    """
+    Stale-while-revalidate cache of the top 100 solved problem ids per handle.
+
+    Entries are kept in redis (any client exposing `get`, `set` and `setex`), or in-process without one.
+    Fresh entries are served as is. Stale entries are served as well, while a background
+    refresh fetches the handle again. Unknown handles are cached as negative entries,
+    which expire on their own instead of going stale.
+    """
+
+    PREFIX = 'boj_llmrec:top100'
+
+    def __init__(self, downloader, redis_client=None, fresh_ttl_sec: int = 3600, stale_ttl_sec: int = 86400,
+                 negative_ttl_sec: int = 600, max_size: int = 4096) -> None:
+        """Initialize cache.
+
+        Parameters
+        ----------
+        downloader : ThreadedDataDownloader
+            Client fetching top 100 problems
+        redis_client : redis.Redis, optional
+            Synchronous redis client shared between workers
+        fresh_ttl_sec : int
+            Age after which an entry is refreshed in the background
+        stale_ttl_sec : int
+            Age after which an entry is dropped and fetched in the foreground
+        negative_ttl_sec : int
+            Age after which an unknown handle is fetched again
+        max_size : int
+            Max number of in-process entries, when there is no redis
+        """
+        self.downloader = downloader
+        self.redis_client = redis_client
+        self.fresh_ttl_sec = fresh_ttl_sec
+        self.stale_ttl_sec = stale_ttl_sec
+        self.negative_ttl_sec = negative_ttl_sec
+        self.max_size = max_size
+        self._local: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def key(self, handle: str) -> str:
+        return f'{Top100Cache.PREFIX}:{handle}'
+
+    def get(self, handle: str) -> list[int] | None:
+        """Get top 100 problem ids solved by the handle, None if the handle is unknown.
+
+        Only a cache miss waits for solved.ac, and its fetch errors (httpx.HTTPError) are raised.
+        """
+        entry = self._read(self.key(handle))
+        if entry is None:
+            return self._fetch(handle)
+        if entry['problem_ids'] is not None and time.time() - entry['fetched_at'] >= self.fresh_ttl_sec:
+            self._refresh_in_background(handle)
+        return entry['problem_ids']
+
+    def _fetch(self, handle: str) -> list[int] | None:
+        try:
+            problems = self.downloader.get_top_100_problems(handle)
+        except httpx.HTTPStatusError as e:
+            # solved.ac answers 404 for handles that do not exist, other errors are not cached
+            if e.response.status_code != 404:
+                raise
+            self._write(self.key(handle), None, self.negative_ttl_sec)
+            return None
+        problem_ids = [problem['problemId'] for problem in problems]
+        self._write(self.key(handle), problem_ids, self.stale_ttl_sec)
+        return problem_ids
+
+    def _refresh_in_background(self, handle: str) -> None:
+        with self._lock:
+            if handle in self._refreshing:
+                return
+            self._refreshing.add(handle)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='top100-refresh')
+        # Other workers serving the same stale entry leave the refresh to the first one
+        if self.redis_client is not None:
+            try:
+                if not self.redis_client.set(f'{self.key(handle)}:refreshing', b'1', nx=True, ex=30):
+                    with self._lock:
+                        self._refreshing.discard(handle)
+                    return
+            except Exception as e:
+                print(f"[Top100Cache] Failed to lock the refresh of {handle}: {e}")
+        self._executor.submit(self._refresh, handle)
+
+    def _refresh(self, handle: str) -> None:
+        try:
+            self._fetch(handle)
+        except Exception as e:
+            print(f"[Top100Cache] Failed to refresh {handle}, serving the stale entry: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(handle)
+
+    def _read(self, key: str) -> dict | None:
+        if self.redis_client is None:
+            with self._lock:
+                entry = self._local.get(key)
+                if entry is None:
+                    return None
+                expire_at, payload = entry
+                if expire_at <= time.monotonic():
+                    del self._local[key]
+                    return None
+                self._local.move_to_end(key)
+        else:
+            try:
+                payload = self.redis_client.get(key)
+            except Exception as e:
+                print(f"[Top100Cache] Failed to read {key} from redis: {e}")
+                return None
+            if payload is None:
+                return None
+        return json.loads(payload)
+
+    def _write(self, key: str, problem_ids: list[int] | None, ttl_sec: int) -> None:
+        payload = json.dumps({'fetched_at': time.time(), 'problem_ids': problem_ids}).encode()
+        if self.redis_client is None:
+            with self._lock:
+                self._local[key] = (time.monotonic() + ttl_sec, payload)
+                self._local.move_to_end(key)
+                while len(self._local) > self.max_size:
+                    self._local.popitem(last=False)
+            return
+        try:
+            self.redis_client.setex(key, ttl_sec, payload)
+        except Exception as e:
+            print(f"[Top100Cache] Failed to write {key} to redis: {e}")
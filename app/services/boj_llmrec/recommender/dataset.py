@@ -1,16 +1,85 @@
+import os
+import glob
+import hashlib
 import numpy as np
 import pandas as pd
 from functools import cached_property
-from scipy.sparse import csr_matrix, vstack, hstack, diags
+from scipy.sparse import csr_matrix, vstack, hstack, diags, save_npz, load_npz
+
+from .encoder import Encoder
+from .utils import atomic_write
 
 class Dataset:
+
+    # Matrices persisted by save_matrices, in dependency order
+    MATRIX_NAMES = ('user_item_matrix', 'extended_adj_matrix', 'normalized_matrix')
+
     def __init__(self, train_interactions: pd.DataFrame, test_interactions: pd.DataFrame,
-                 user_info: pd.DataFrame, item_info: pd.DataFrame) -> None:
+                 user_info: pd.DataFrame, item_info: pd.DataFrame, check_integrity: bool = True) -> None:
         self.train_interactions = train_interactions
         self.test_interactions = test_interactions
         self.user_info = user_info
         self.item_info = item_info
-        self._check_integrity()
+        if check_integrity:
+            self._check_integrity()
+
+    @staticmethod
+    def cache_key(csv_path: str, encoder: Encoder) -> str:
+        """Get a key identifying the matrices built from the csv encoded with the encoder."""
+        digest = hashlib.sha1()
+        with open(csv_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        for vocabulary in [encoder.user_encoder.vocabulary, encoder.item_encoder.vocabulary]:
+            digest.update(str(vocabulary.dtype).encode())
+            digest.update(np.ascontiguousarray(vocabulary).tobytes())
+        return digest.hexdigest()[:16]
+
+    @staticmethod
+    def _matrix_path(cache_dir: str, key: str, name: str) -> str:
+        return os.path.join(cache_dir, f'dataset_{key}_{name}.npz')
+
+    def save_matrices(self, cache_dir: str, key: str) -> None:
+        """Save the matrices under the key and remove the matrices of other keys."""
+        os.makedirs(cache_dir, exist_ok=True)
+        paths = [Dataset._matrix_path(cache_dir, key, name) for name in Dataset.MATRIX_NAMES]
+        for name, path in zip(Dataset.MATRIX_NAMES, paths):
+            matrix = getattr(self, name).tocsr()
+            # Workers building the same key at once each write their own temporary file
+            atomic_write(path, lambda f: save_npz(f, matrix))
+        # Keys change with every csv, e.g. after each fold-in, so only the latest matrices are kept
+        for path in glob.glob(os.path.join(cache_dir, 'dataset_*_*.npz')):
+            if path not in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def load_or_build(cls, train_interactions: pd.DataFrame, cache_dir: str, key: str,
+                      test_interactions: pd.DataFrame = None) -> 'Dataset':
+        """Get a dataset whose matrices are loaded from the cache when the key matches, built and saved otherwise.
+
+        Interactions are the same for the same key, so the integrity check is skipped on a cache hit.
+        """
+        paths = [cls._matrix_path(cache_dir, key, name) for name in Dataset.MATRIX_NAMES]
+        if not all(os.path.exists(path) for path in paths):
+            dataset = cls(train_interactions, test_interactions, None, None)
+            dataset.save_matrices(cache_dir, key)
+            return dataset
+
+        dataset = cls(train_interactions, test_interactions, None, None, check_integrity=False)
+        # Filling the cached properties directly, so they are never rebuilt from pandas
+        try:
+            for name, path in zip(Dataset.MATRIX_NAMES, paths):
+                dataset.__dict__[name] = load_npz(path)
+        except OSError:
+            # Removed by a process saving the matrices of another key in between
+            dataset = cls(train_interactions, test_interactions, None, None)
+            dataset.save_matrices(cache_dir, key)
+            return dataset
+        dataset.__dict__['user_cnt'], dataset.__dict__['item_cnt'] = dataset.user_item_matrix.shape
+        return dataset
 
     def _check_integrity(self) -> None:
         ordinal_series = [
@@ -25,6 +94,34 @@ class Dataset:
             assert series.min() == 0
             assert series.max() == series.nunique() - 1
 
+    def append_interactions(self, interactions: pd.DataFrame) -> 'Dataset':
+        """Get a dataset with encoded interactions appended, new users taking the ids from user_cnt on.
+
+        Items must already be in the dataset. The user-item matrix is grown from the current one,
+        so nothing is rebuilt from pandas, and the graph matrices are derived from it on first use.
+        """
+        if len(interactions) == 0:
+            return self
+        user_ids = interactions['user_id'].values
+        item_ids = interactions['item_id'].values
+        if item_ids.min() < 0 or item_ids.max() >= self.item_cnt:
+            raise ValueError("Interactions with unknown items cannot be appended.")
+        user_cnt = max(self.user_cnt, int(user_ids.max()) + 1)
+        current = self.user_item_matrix
+        grown = vstack([current, csr_matrix((user_cnt - self.user_cnt, self.item_cnt), dtype=current.dtype)])
+        appended = csr_matrix((np.ones(len(user_ids), dtype=current.dtype), (user_ids, item_ids)),
+                              shape=(user_cnt, self.item_cnt))
+        # Repeated interactions stay binary
+        user_item_matrix = ((grown + appended) > 0).astype(current.dtype).tocsr()
+
+        train_interactions = pd.concat([self.train_interactions, interactions[['user_id', 'item_id']]],
+                                       ignore_index=True)
+        dataset = Dataset(train_interactions, self.test_interactions, self.user_info, self.item_info,
+                          check_integrity=False)
+        dataset.__dict__['user_item_matrix'] = user_item_matrix
+        dataset.__dict__['user_cnt'], dataset.__dict__['item_cnt'] = user_item_matrix.shape
+        return dataset
+
     @cached_property
     def user_cnt(self) -> int:
         return self.train_interactions['user_id'].nunique()
@@ -47,6 +144,8 @@ class Dataset:
         item_ids = self.train_interactions['item_id']
         data = np.ones_like(user_ids)
         user_item_matrix = csr_matrix((data, (user_ids, item_ids)), shape=(self.user_cnt, self.item_cnt))
+        # Repeated interactions stay binary, as in append_interactions
+        user_item_matrix.data[:] = 1
         return user_item_matrix
 
     @cached_property
@@ -1,31 +1,101 @@
+import os
 import numpy as np
 import pandas as pd
-from sklearn.preprocessing import OrdinalEncoder
+
+class IdEncoder:
+    """
+    Ordinal encoder of ids into [0, n), unknown ids are encoded as -1.
+
+    Non-negative integer ids within `max_dense_id` are encoded with a dense lookup table,
+    other ids (e.g. handles) with a binary search over the sorted vocabulary.
+    Ids added by `extend` take the next codes, so `vocabulary` is in code order and only sorted right after `fit`.
+    """
+
+    def __init__(self, max_dense_id: int = 1 << 24) -> None:
+        self.max_dense_id = max_dense_id
+        self.vocabulary = None
+        self._lookup = None
+        self._sorted_vocabulary = None
+        self._sorted_codes = None
+
+    def fit(self, ids: np.ndarray) -> 'IdEncoder':
+        self._set_vocabulary(np.unique(np.asarray(ids)))
+        return self
+
+    def extend(self, ids: np.ndarray) -> 'IdEncoder':
+        """Add unknown ids at the end of the vocabulary, keeping the codes of known ids."""
+        if self.vocabulary is None:
+            return self.fit(ids)
+        ids = np.asarray(ids).ravel()
+        new_ids = np.unique(ids[self.transform(ids) < 0])
+        if len(new_ids):
+            if self.vocabulary.dtype.kind == 'U':
+                new_ids = new_ids.astype(str)
+            self._set_vocabulary(np.concatenate([self.vocabulary, new_ids]))
+        return self
+
+    def _set_vocabulary(self, vocabulary: np.ndarray) -> None:
+        if vocabulary.dtype == object:
+            # Fixed-width strings, so that the vocabulary can be saved without pickle
+            vocabulary = vocabulary.astype(str)
+        self.vocabulary = vocabulary
+        self._lookup = None
+        is_integer = np.issubdtype(vocabulary.dtype, np.integer)
+        if is_integer and len(vocabulary) and vocabulary.min() >= 0 and vocabulary.max() < self.max_dense_id:
+            self._lookup = np.full(vocabulary.max() + 1, -1, dtype=np.int32)
+            self._lookup[vocabulary] = np.arange(len(vocabulary), dtype=np.int32)
+        # Codes of the sorted vocabulary, None while the vocabulary itself is sorted
+        order = np.argsort(vocabulary, kind='stable')
+        is_sorted = np.array_equal(order, np.arange(len(vocabulary)))
+        self._sorted_vocabulary = vocabulary if is_sorted else vocabulary[order]
+        self._sorted_codes = None if is_sorted else order
+
+    def transform(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids).ravel()
+        if self._lookup is not None and np.issubdtype(ids.dtype, np.integer):
+            encoded = np.full(len(ids), -1, dtype=np.int64)
+            in_range = (ids >= 0) & (ids < len(self._lookup))
+            encoded[in_range] = self._lookup[ids[in_range]]
+            return encoded
+        if self.vocabulary.dtype.kind == 'U':
+            ids = ids.astype(str)
+        positions = np.searchsorted(self._sorted_vocabulary, ids)
+        positions = np.minimum(positions, len(self._sorted_vocabulary) - 1)
+        codes = positions if self._sorted_codes is None else self._sorted_codes[positions]
+        return np.where(self._sorted_vocabulary[positions] == ids, codes, -1)
+
+    def inverse_transform(self, encoded_ids: np.ndarray) -> np.ndarray:
+        return self.vocabulary[np.asarray(encoded_ids).ravel()]
+
+    def save(self, path: str) -> None:
+        np.save(path, self.vocabulary)
+
+    @classmethod
+    def load(cls, path: str) -> 'IdEncoder':
+        # The vocabulary is kept as saved, since extended vocabularies are not sorted
+        encoder = cls()
+        encoder._set_vocabulary(np.load(path))
+        return encoder
 
 class Encoder:
 
+    USER_VOCABULARY_FILE = 'user_vocabulary.npy'
+    ITEM_VOCABULARY_FILE = 'item_vocabulary.npy'
+
     def __init__(self) -> None:
-        self.user_encoder = OrdinalEncoder(dtype=int, handle_unknown='use_encoded_value', unknown_value=-1)
-        # self.user_encoder = OrdinalEncoder(dtype=int, handle_unknown='error')
-        self.item_encoder = OrdinalEncoder(dtype=int, handle_unknown='use_encoded_value', unknown_value=-1)
-        # self.item_encoder = OrdinalEncoder(dtype=int, handle_unknown='error')
+        self.user_encoder = IdEncoder()
+        self.item_encoder = IdEncoder()
 
     def fit(self, interactions: pd.DataFrame) -> pd.DataFrame:
-        self.user_encoder.fit(
-            interactions['user_id'].values.reshape(-1, 1)
-        )
-        self.item_encoder.fit(
-            interactions['item_id'].values.reshape(-1, 1)
-        )
+        self.user_encoder.fit(interactions['user_id'].values)
+        self.item_encoder.fit(interactions['item_id'].values)
         return self
 
     def transform(self, interactions: pd.DataFrame) -> pd.DataFrame:
-        interactions.loc[:, 'user_id'] = self.user_encoder.transform(
-            interactions['user_id'].values.reshape(-1, 1)
-        ).ravel()
-        interactions.loc[:, 'item_id'] = self.item_encoder.transform(
-            interactions['item_id'].values.reshape(-1, 1)
-        ).ravel()
+        interactions = interactions.assign(
+            user_id=self.user_encoder.transform(interactions['user_id'].values),
+            item_id=self.item_encoder.transform(interactions['item_id'].values),
+        )
         interactions = interactions[
             (interactions['user_id'] != -1) &
             (interactions['item_id'] != -1)
@@ -36,10 +106,18 @@ class Encoder:
         return self.fit(interactions).transform(interactions)
 
     def inverse_transform(self, interactions: pd.DataFrame) -> pd.DataFrame:
-        interactions.loc[:, 'user_id'] = self.user_encoder.inverse_transform(
-            interactions['user_id'].values.reshape(-1, 1)
-        ).ravel()
-        interactions.loc[:, 'item_id'] = self.item_encoder.inverse_transform(
-            interactions['item_id'].values.reshape(-1, 1)
-        ).ravel()
-        return interactions
+        return interactions.assign(
+            user_id=self.user_encoder.inverse_transform(interactions['user_id'].values),
+            item_id=self.item_encoder.inverse_transform(interactions['item_id'].values),
+        )
+
+    def save(self, dir_path: str) -> None:
+        self.user_encoder.save(os.path.join(dir_path, Encoder.USER_VOCABULARY_FILE))
+        self.item_encoder.save(os.path.join(dir_path, Encoder.ITEM_VOCABULARY_FILE))
+
+    @classmethod
+    def load(cls, dir_path: str) -> 'Encoder':
+        encoder = cls()
+        encoder.user_encoder = IdEncoder.load(os.path.join(dir_path, Encoder.USER_VOCABULARY_FILE))
+        encoder.item_encoder = IdEncoder.load(os.path.join(dir_path, Encoder.ITEM_VOCABULARY_FILE))
+        return encoder
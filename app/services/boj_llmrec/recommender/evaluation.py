@@ -0,0 +1,125 @@
+import time
+import numpy as np
+import pandas as pd
+from typing import Callable, Iterable
+from scipy.sparse import csr_matrix
+
+from .solved_set import SolvedSet
+
+def hit_matrix(topk: np.ndarray, truth: csr_matrix) -> np.ndarray:
+    """Get hits[u, i] = whether topk[u, i] is a ground truth item of user u.
+
+    Membership is tested by binary search over sorted (user, item) keys, so no per-user sets are built.
+    """
+    truth = truth.tocsr()
+    topk = np.asarray(topk, dtype=np.int64)
+    # Keys must be unique across users for ids outside the columns of the truth as well
+    item_cnt = max(truth.shape[1], int(topk.max()) + 1 if topk.size else 0)
+    users = np.repeat(np.arange(truth.shape[0], dtype=np.int64), np.diff(truth.indptr))
+    truth_keys = np.sort(users * item_cnt + truth.indices)
+    if len(truth_keys) == 0:
+        return np.zeros(topk.shape, dtype=bool)
+    keys = np.arange(len(topk), dtype=np.int64)[:, None] * item_cnt + topk
+    positions = np.minimum(np.searchsorted(truth_keys, keys), len(truth_keys) - 1)
+    return truth_keys[positions] == keys
+
+def evaluate(topk: np.ndarray, truth: csr_matrix, k: int = 10, item_cnt: int = None) -> dict:
+    """Get ranking quality of the top k items of every user.
+
+    Users without ground truth items are left out of the averages.
+
+    Parameters
+    ----------
+    topk : np.ndarray
+        (user_cnt, >= k) encoded item ids, best first, row u being user u of `truth`
+    truth : csr_matrix
+        (user_cnt, item_cnt) held-out interactions
+    k : int
+        Cutoff of the metrics
+    item_cnt : int
+        Size of the catalogue for coverage, the number of columns of `truth` if None
+
+    Returns
+    -------
+    dict
+        {'recall@k', 'ndcg@k', 'map@k', 'coverage@k'}
+    """
+    topk = np.asarray(topk)[:, :k]
+    hits = hit_matrix(topk, truth)
+    true_cnt = np.diff(truth.tocsr().indptr)
+    users = true_cnt > 0
+    hits, true_cnt = hits[users], true_cnt[users]
+    ideal_cnt = np.minimum(true_cnt, k)
+
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    dcg = (hits * discounts).sum(axis=1)
+    idcg = np.cumsum(discounts)[ideal_cnt - 1]
+    # Precision at each hit position, averaged over the best achievable number of hits
+    precision = np.cumsum(hits, axis=1) / np.arange(1, k + 1)
+    average_precision = (precision * hits).sum(axis=1) / ideal_cnt
+
+    def mean(values: np.ndarray) -> float:
+        return float(values.mean()) if len(values) else -1.
+
+    return {
+        f'recall@{k}': mean(hits.sum(axis=1) / true_cnt),
+        f'ndcg@{k}': mean(dcg / idcg),
+        f'map@{k}': mean(average_precision),
+        f'coverage@{k}': len(np.unique(topk)) / (item_cnt or truth.shape[1]),
+    }
+
+def latency_percentiles(fn: Callable, inputs: Iterable, percentiles: tuple[int] = (50, 90, 99)) -> dict:
+    """Call fn once per input and get the latency percentiles in milliseconds."""
+    seconds = []
+    for x in inputs:
+        start = time.perf_counter()
+        fn(x)
+        seconds.append(time.perf_counter() - start)
+    values = np.percentile(np.array(seconds) * 1000, percentiles)
+    return {f'p{p}_ms': float(value) for p, value in zip(percentiles, values)}
+
+def evaluate_latency(recommender, user_handles: Iterable[str], problem_ids: Iterable[int], k: int = 10) -> dict:
+    """Get per-call latency percentiles of the recommender's ranking methods.
+
+    Solved sets of every handle are filled in before timing, from the interaction snapshot when the handle
+    is in it, so the timed calls never wait for solved.ac nor its rate limit.
+    get_recommended_problems is then timed for the recommendation cache lookup, the MultiVAE forward pass,
+    solved-item masking and the top-k ranking, get_similar_problems for the neighbour table lookup.
+    Rankings are lazy, so the first k rows are materialized as the LLM tools do.
+    Repeated handles are served from the recommendation cache, so pass distinct handles for cold latency.
+
+    Parameters
+    ----------
+    recommender : Recommender
+        Recommender with its models loaded
+    user_handles : Iterable[str]
+        Handles passed to get_recommended_problems
+    problem_ids : Iterable[int]
+        Raw problem ids passed to get_similar_problems
+    k : int
+        Number of rows materialized per ranking
+    """
+    user_handles = list(user_handles)
+    for handle in user_handles:
+        solved_ids = recommender.solved_store.get(handle) if recommender.solved_store is not None else None
+        if solved_ids is not None:
+            recommender.solved_set_cache.set(handle, SolvedSet.from_ids(solved_ids, recommender.item_cnt))
+        else:
+            recommender.get_solved_set(handle)
+    return {
+        'get_recommended_problems': latency_percentiles(
+            lambda handle: recommender.get_recommended_problems(handle).rows(k), user_handles),
+        'get_similar_problems': latency_percentiles(
+            lambda problem_id: recommender.get_similar_problems(problem_id).rows(k), problem_ids),
+    }
+
+def truth_matrix(test_interactions: pd.DataFrame, user_cnt: int) -> csr_matrix:
+    """Get the CSR ground truth of encoded test interactions of users [0, user_cnt).
+
+    Held-out items never seen in training still count as ground truth, so columns span every test item.
+    """
+    test_interactions = test_interactions[test_interactions['user_id'] < user_cnt]
+    user_ids = test_interactions['user_id'].values
+    item_ids = test_interactions['item_id'].values
+    shape = (user_cnt, int(item_ids.max()) + 1 if len(item_ids) else 0)
+    return csr_matrix((np.ones(len(user_ids), dtype=np.float32), (user_ids, item_ids)), shape=shape)
@@ -0,0 +1,82 @@
+import time
+import queue
+import asyncio
+import threading
+import numpy as np
+import torch
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from .MultiVAE import MultiVAE
+
+class BatchedInferenceExecutor:
+    """
+    Micro-batching executor for MultiVAE inference.
+
+    Requests arriving within a short window are stacked into one batched forward pass,
+    which runs under inference mode on a dedicated thread pool.
+    """
+
+    def __init__(self, model: MultiVAE, max_batch_size: int = 64, max_wait_ms: float = 5, num_workers: int = 1) -> None:
+        """Initialize executor.
+
+        Parameters
+        ----------
+        model : MultiVAE
+            Model used for inference, expected to be in eval mode
+        max_batch_size : int
+            Max number of requests in one forward pass
+        max_wait_ms : float
+            Max milliseconds the first request of a batch waits for others to join
+        num_workers : int
+            Number of threads running forward passes
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait_sec = max_wait_ms / 1000
+        self._queue: queue.Queue[tuple[list[int], Future]] = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix='multivae-inference')
+        self._collector = threading.Thread(target=self._collect, name='multivae-batcher', daemon=True)
+        self._collector.start()
+
+    def submit(self, solved_ids: list[int]) -> Future:
+        """Queue a request, the future resolves to the score of every item."""
+        future = Future()
+        self._queue.put((solved_ids, future))
+        return future
+
+    async def infer(self, solved_ids: list[int]) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(solved_ids))
+
+    def _collect(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_sec
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._pool.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: list[tuple[list[int], Future]]) -> None:
+        batch = [(solved_ids, future) for solved_ids, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        try:
+            rows = np.concatenate([np.full(len(solved_ids), row) for row, (solved_ids, _) in enumerate(batch)])
+            cols = np.concatenate([np.asarray(solved_ids, dtype=np.int64) for solved_ids, _ in batch])
+            indices = torch.tensor(np.array([rows, cols]), dtype=torch.long)
+            values = torch.ones(len(cols), dtype=torch.float32)
+            is_solved = torch.sparse_coo_tensor(indices, values, size=(len(batch), self.model.item_cnt))
+            with torch.inference_mode():
+                scores, _, _ = self.model(is_solved)
+            scores = scores.to('cpu').numpy()
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for row, (_, future) in enumerate(batch):
+            future.set_result(scores[row])
@@ -1,11 +1,11 @@
 import torch
+from .utils import csr_to_sparse_tensor, chunked_topk
 from .dataset import Dataset
 
 class MultiVAE(torch.nn.Module):
     def __init__(self, dataset: Dataset) -> None:
         super(MultiVAE, self).__init__()
         self.dataset = dataset
-        self.user_item_matrix = torch.tensor(self.dataset.user_item_matrix.todense(), dtype=torch.float32)
 
         self.dropout = torch.nn.Dropout(p=0.5)
         self.encoder_dim = [self.dataset.item_cnt] + [2000, 300]
@@ -20,14 +20,33 @@ class MultiVAE(torch.nn.Module):
         )
 
     def forward(self, input: torch.Tensor) -> torch.Tensor:
-        input = torch.nn.functional.normalize(input)
-        input = self.dropout(input)
+        if input.is_sparse:
+            input = self.normalize_sparse(input)
+        else:
+            input = torch.nn.functional.normalize(input)
+            input = self.dropout(input)
 
         mu, log_var = self.encode(input)
         z = self.reparametrize(mu, log_var)
         recon_input = self.decode(z)
         return recon_input, mu, log_var
 
+    def normalize_sparse(self, input: torch.Tensor) -> torch.Tensor:
+        input = input.coalesce()
+        rows = input.indices()[0]
+        values = input.values().to(torch.float32)
+        row_norm = torch.zeros(input.shape[0], device=values.device).index_add_(0, rows, values ** 2)
+        values = values / row_norm.sqrt().clamp_min(1e-12)[rows]
+        # Dropout is applied on the stored values only, same as on the dense input
+        values = self.dropout(values)
+        return torch.sparse_coo_tensor(input.indices(), values, input.shape)
+
+    def linear(self, layer: torch.nn.Linear, x: torch.Tensor) -> torch.Tensor:
+        if x.is_sparse:
+            # Cost scales with the number of solved items instead of the catalogue size
+            return torch.sparse.mm(x, layer.weight.T) + layer.bias
+        return layer(x)
+
     def reparametrize(self, mu: torch.Tensor, log_var: torch.Tensor) -> torch.Tensor:
         if self.training:
             std = torch.exp(0.5 * log_var)
@@ -38,9 +57,9 @@ class MultiVAE(torch.nn.Module):
 
     def encode(self, x: torch.Tensor) -> torch.Tensor:
         for layer in self.encoder_layers[:-1]:
-            x = layer(x)
+            x = self.linear(layer, x)
             x = torch.tanh(x)
-        x = self.encoder_layers[-1](x)
+        x = self.linear(self.encoder_layers[-1], x)
         mu, log_var = x.chunk(2, dim=1)
         return mu, log_var
 
@@ -51,15 +70,13 @@ class MultiVAE(torch.nn.Module):
         z = self.decoder_layers[-1](z)
         return z
 
-    def get_topk(self, k: int) -> torch.Tensor:
-        scores, _, _ = self.forward(self.user_item_matrix)
-        trues = self.dataset.train_interactions.groupby('user_id')['item_id'].apply(list)
-        for user_id, items in trues.items():
-            scores[user_id, items] = -1e9
-        topk = torch.topk(scores, k=k, dim=1).indices
-        return topk
+    def get_topk(self, k: int, chunk_size: int = 1024) -> torch.Tensor:
+        device = next(self.parameters()).device
+        user_item_matrix = self.dataset.user_item_matrix
+
+        def score_fn(start: int, end: int) -> torch.Tensor:
+            # Users are fed as sparse rows, the first encoder layer never densifies them
+            scores, _, _ = self.forward(csr_to_sparse_tensor(user_item_matrix[start:end]).to(device))
+            return scores
 
-    def to(self, device: str):
-        super(MultiVAE, self).to(device)
-        self.user_item_matrix = self.user_item_matrix.to(device)
-        return self
\ No newline at end of file
+        return chunked_topk(score_fn, user_item_matrix, k, chunk_size)
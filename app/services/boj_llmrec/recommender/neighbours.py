@@ -0,0 +1,140 @@
+import os
+import glob
+from typing import Callable
+import numpy as np
+import pandas as pd
+import torch
+
+from .ranking import RankedProblems
+from .LightGCN import LightGCN
+from .utils import atomic_write
+
+class ItemNeighbours:
+    """
+    Precomputed top-N neighbour table over propagated LightGCN item embeddings.
+
+    The normalized embedding matrix and neighbour ids are stored as .npy files
+    and memory-mapped, so every worker shares the same pages.
+    """
+
+    def __init__(self, embeddings: np.ndarray, neighbour_ids: np.ndarray) -> None:
+        self.embeddings = embeddings
+        self.neighbour_ids = neighbour_ids
+
+    @property
+    def item_cnt(self) -> int:
+        return self.embeddings.shape[0]
+
+    @property
+    def neighbour_cnt(self) -> int:
+        return self.neighbour_ids.shape[1]
+
+    @staticmethod
+    def _paths(dir_path: str, version: str) -> tuple[str, str]:
+        prefix = os.path.join(dir_path, f'item_neighbours_{version}')
+        return f'{prefix}_embeddings.npy', f'{prefix}_ids.npy'
+
+    @staticmethod
+    def propagated_item_embedding(model: LightGCN) -> torch.Tensor:
+        with torch.no_grad():
+            _, item_embedding = model.get_embeddings()
+        return item_embedding
+
+    @classmethod
+    def build(cls, item_embedding: torch.Tensor, neighbour_cnt: int = 100, chunk_size: int = 1024) -> 'ItemNeighbours':
+        """Build the neighbour table from propagated item embeddings.
+
+        Parameters
+        ----------
+        item_embedding : torch.Tensor
+            Propagated LightGCN item embeddings
+        neighbour_cnt : int
+            Number of neighbours kept per item
+        chunk_size : int
+            Number of items scored at once, bounds the memory used by the build
+        """
+        item_embedding = torch.nn.functional.normalize(item_embedding.detach().to('cpu').float(), dim=1)
+        item_cnt = item_embedding.shape[0]
+        neighbour_cnt = min(neighbour_cnt, item_cnt - 1)
+        neighbour_ids = np.empty((item_cnt, neighbour_cnt), dtype=np.int32)
+        with torch.no_grad():
+            for start in range(0, item_cnt, chunk_size):
+                end = min(start + chunk_size, item_cnt)
+                similarities = item_embedding[start:end] @ item_embedding.T
+                # An item is never its own neighbour
+                similarities[torch.arange(end - start), torch.arange(start, end)] = -np.inf
+                neighbour_ids[start:end] = torch.topk(similarities, k=neighbour_cnt, dim=1).indices.numpy()
+        return cls(item_embedding.numpy(), neighbour_ids)
+
+    def save(self, dir_path: str, version: str) -> None:
+        """Save the table of the model version and remove the tables of other versions.
+
+        Files are replaced rather than overwritten, since workers may have them memory-mapped,
+        so workers building the same version at once only duplicate work.
+        """
+        paths = self._paths(dir_path, version)
+        for path, array in zip(paths, [self.embeddings, self.neighbour_ids]):
+            atomic_write(path, lambda f: np.save(f, array))
+        # Unlinking leaves the pages of workers still mapping an old table valid
+        for path in glob.glob(os.path.join(dir_path, 'item_neighbours_*.npy')):
+            if path not in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    @classmethod
+    def load(cls, dir_path: str, version: str) -> 'ItemNeighbours':
+        return cls(*[np.load(path, mmap_mode='r') for path in cls._paths(dir_path, version)])
+
+    @classmethod
+    def load_or_build(cls, item_embedding_fn: Callable[[], torch.Tensor], dir_path: str, version: str,
+                      neighbour_cnt: int = 100) -> 'ItemNeighbours':
+        if all(os.path.exists(path) for path in cls._paths(dir_path, version)):
+            try:
+                return cls.load(dir_path, version)
+            except OSError as e:
+                # Removed by a worker saving a newer version in between
+                print(f"Failed to load item neighbours from {dir_path}: {e}")
+        neighbours = cls.build(item_embedding_fn(), neighbour_cnt)
+        try:
+            neighbours.save(dir_path, version)
+            return cls.load(dir_path, version)
+        except OSError as e:
+            print(f"Failed to save item neighbours to {dir_path}: {e}")
+            return neighbours
+
+    def exact_scores(self, item_id: int) -> np.ndarray:
+        scores = self.embeddings @ self.embeddings[item_id]
+        scores[item_id] = -np.inf
+        return scores
+
+class SimilarProblems(RankedProblems):
+    """
+    Ranking of problems similar to one item.
+
+    Prefixes within the neighbour table are sliced from it as stored, so nothing of catalogue size
+    is allocated, and exact scores over every item are only computed for a deeper prefix.
+    """
+
+    def __init__(self, neighbours: ItemNeighbours, item_id: int, problem_info: pd.DataFrame, item_rows: np.ndarray) -> None:
+        self.neighbours = neighbours
+        self.item_id = item_id
+        self.problem_info = problem_info
+        self.item_rows = item_rows
+        self._order = np.empty(0, dtype=np.int64)
+        self._scores = None
+        # Every item but the target is reachable through the exact fallback
+        self._valid_cnt = neighbours.item_cnt - 1
+
+    @property
+    def scores(self) -> np.ndarray:
+        if self._scores is None:
+            self._scores = self.neighbours.exact_scores(self.item_id)
+        return self._scores
+
+    def top(self, k: int) -> np.ndarray:
+        if k <= self.neighbours.neighbour_cnt:
+            # Rows of the table are sorted best first when built
+            return np.asarray(self.neighbours.neighbour_ids[self.item_id, :k], dtype=np.int64)
+        return super(SimilarProblems, self).top(k)
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+from typing import Callable
+
+class RankedProblems:
+    """
+    Problems ranked by score, ordered lazily.
+
+    Only the prefix that is actually requested gets sorted (argpartition + argsort of k items),
+    and catalogue rows are only materialized for that prefix.
+    Items with a score of -inf are excluded from the ranking.
+    A ranking built from a truncated prefix computes the full scores once a deeper prefix is requested.
+    """
+
+    _scores_fn = None
+
+    def __init__(self, scores: np.ndarray, problem_info: pd.DataFrame, item_rows: np.ndarray) -> None:
+        """Initialize ranked problems.
+
+        Parameters
+        ----------
+        scores : np.ndarray
+            Score of every encoded item id
+        problem_info : pd.DataFrame
+            Problem catalogue
+        item_rows : np.ndarray
+            Row position in problem_info of every encoded item id, -1 if the problem is missing
+        """
+        self.scores = scores
+        self.problem_info = problem_info
+        self.item_rows = item_rows
+        self._order = np.empty(0, dtype=np.int64)
+        self._valid_cnt = int(np.count_nonzero(scores > -np.inf))
+
+    @classmethod
+    def from_order(cls, item_ids: np.ndarray, item_cnt: int, problem_info: pd.DataFrame, item_rows: np.ndarray,
+                   scores_fn: Callable[[], np.ndarray] = None, valid_cnt: int = None) -> 'RankedProblems':
+        """Get a ranking of item_ids in the given order.
+
+        With scores_fn, item_ids is the prefix of a ranking of valid_cnt items, and scores_fn returns
+        the full scores it was cut from. It is only called once a prefix deeper than item_ids is requested.
+        """
+        scores = np.full(item_cnt, -np.inf, dtype=np.float32)
+        scores[item_ids] = np.arange(len(item_ids), 0, -1, dtype=np.float32)
+        ranked = cls(scores, problem_info, item_rows)
+        if scores_fn is not None and valid_cnt > len(item_ids):
+            ranked._scores_fn = scores_fn
+            ranked._prefix_cnt = len(item_ids)
+            ranked._valid_cnt = valid_cnt
+        return ranked
+
+    def _expand(self) -> None:
+        self.scores = self._scores_fn()
+        self._scores_fn = None
+        self._order = np.empty(0, dtype=np.int64)
+        self._valid_cnt = int(np.count_nonzero(self.scores > -np.inf))
+
+    def __len__(self) -> int:
+        return self._valid_cnt
+
+    def top(self, k: int) -> np.ndarray:
+        """Get top k encoded item ids in descending order of score."""
+        k = min(k, self._valid_cnt)
+        if self._scores_fn is not None and k > self._prefix_cnt:
+            self._expand()
+            k = min(k, self._valid_cnt)
+        if k > len(self._order):
+            neg_scores = -self.scores
+            if k < len(neg_scores):
+                candidates = np.argpartition(neg_scores, k - 1)[:k]
+            else:
+                candidates = np.arange(len(neg_scores))
+            self._order = candidates[np.argsort(neg_scores[candidates], kind='stable')][:k]
+        return self._order[:k]
+
+    def rows(self, k: int) -> pd.DataFrame:
+        """Get catalogue rows of the top k problems."""
+        positions = self.item_rows[self.top(k)]
+        positions = positions[positions >= 0]
+        return self.problem_info.iloc[positions].reset_index(drop=True)
+
+    def restrict(self, mask: np.ndarray) -> 'RankedProblems':
+        """Get a ranking that only keeps the items of the given boolean mask.
+
+        Masked items left out of a truncated ranking are ranked by the full scores when available,
+        otherwise they are kept after every ranked item.
+        """
+        unranked = mask & (self.scores == -np.inf)
+        if unranked.any() and self._scores_fn is not None:
+            self._expand()
+            unranked = mask & (self.scores == -np.inf)
+        scores = np.where(mask, self.scores, -np.inf)
+        if unranked.any():
+            ranked_scores = scores[scores > -np.inf]
+            floor = ranked_scores.min() if len(ranked_scores) else 0
+            scores[unranked] = floor - 1
+        return RankedProblems(scores, self.problem_info, self.item_rows)
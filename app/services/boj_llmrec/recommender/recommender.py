@@ -2,13 +2,24 @@ import os
 import numpy as np
 import pandas as pd
 import torch
-import requests
+import httpx
 import json
+import hashlib
+import shutil
 
 from .dataset import Dataset
 from .encoder import Encoder
 from .splitter import Splitter
-from .downloader import DataDownloader
+from .async_downloader import ThreadedDataDownloader
+from .cache import RecommendationCache, Top100Cache
+from .ranking import RankedProblems
+from .neighbours import ItemNeighbours, SimilarProblems
+from .inference import BatchedInferenceExecutor
+from .bundle import ServingBundle
+from .quantization import quantize_multivae
+from .solved_set import SolvedSet, SolvedSetCache
+from .solved_store import SolvedStore
+from .runner import TrainingRunner, pin_threads
 from .MultiVAE import MultiVAE
 from .MultiVAE import MultiVAETrainer
 from .LightGCN import LightGCN
@@ -16,11 +27,13 @@ from .LightGCN import LightGCNTrainer
 
 class Recommender:
 
-    def __init__(self, data_path: str) -> None:
-        self.solved_info = pd.read_csv(os.path.join(data_path, 'solved_info.csv'), index_col=0)
-        self.solved_info.columns = ['user_id', 'item_id']
-        self.problem_info = pd.read_csv(os.path.join(data_path, 'problem_info.csv'))
-
+    def __init__(self, data_path: str, redis_client=None, cache_topk: int = 1000, bundle_path: str = None,
+                 quantize: bool = False, lightgcn_layers: int = 1, encoder_path: str = None) -> None:
+        """
+        encoder_path: directory of vocabularies saved with the weights by save_model. Codes are kept as saved,
+            so weights of folded-in users stay valid, and only handles unknown to it are appended.
+            The encoder is fit on the csv if None or if nothing was saved there.
+        """
         self.top_100_info = {}
         top_100_path = os.path.join(data_path, 'top_100_for_demo')
         for filename in os.listdir(top_100_path):
@@ -31,103 +44,286 @@ class Recommender:
                 with open(file_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)['items']
                     self.top_100_info[username] = data
-        
-        self._init_recommender()
+
+        # Only the top-K encoded ids of each ranking are cached
+        self.cache_topk = cache_topk
+        self.recommendation_cache = RecommendationCache(redis_client)
+        self.solved_set_cache = SolvedSetCache()
+        # One client for every request thread, so connections and the rate limit are shared
+        self.downloader = ThreadedDataDownloader()
+        self.top_100_cache = Top100Cache(self.downloader, redis_client)
+        self._model_versions = {}
+        self.model_version = ''
+        self.quantize = quantize
+        self.lightgcn_layers = lightgcn_layers
+        self.item_neighbours = None
+        self.is_serving = bundle_path is not None
+        self.data_path = data_path
+        self.encoder_path = encoder_path
+        if self.is_serving:
+            self._load_bundle(bundle_path)
+        else:
+            self.solved_info = pd.read_csv(os.path.join(data_path, 'solved_info.csv'), index_col=0)
+            self.solved_info.columns = ['user_id', 'item_id']
+            self.problem_info = pd.read_csv(os.path.join(data_path, 'problem_info.csv'))
+            self._init_recommender()
 
     def _init_recommender(self) -> None:
-        self.encoder = Encoder()
-        train_df = self.encoder.fit_transform(self.solved_info)
+        if self.encoder_path is not None and os.path.exists(os.path.join(self.encoder_path, Encoder.USER_VOCABULARY_FILE)):
+            self.encoder = Encoder.load(self.encoder_path)
+            self.encoder.user_encoder.extend(self.solved_info['user_id'].values)
+            train_df = self.encoder.transform(self.solved_info)
+        else:
+            self.encoder = Encoder()
+            train_df = self.encoder.fit_transform(self.solved_info)
         train_df['user_id'] = train_df['user_id'].astype(int)
         train_df['item_id'] = train_df['item_id'].astype(int)
-        self.dataset = Dataset(train_df, None, None, None)
-        self.lightgcn_model = LightGCN(self.dataset)
+        # Matrices are rebuilt only when the csv or the vocabularies change
+        self.dataset_key = Dataset.cache_key(os.path.join(self.data_path, 'solved_info.csv'), self.encoder)
+        self.dataset = Dataset.load_or_build(train_df, os.path.join(self.data_path, 'cache'), self.dataset_key)
+        # Row position of every encoded item in problem_info, so rankings never reindex the whole catalogue
+        problem_ids = self.encoder.item_encoder.vocabulary
+        self.item_rows = pd.Index(self.problem_info['problemId']).get_indexer(problem_ids)
+        self.lightgcn_model = LightGCN(self.dataset, n_layers=self.lightgcn_layers)
         self.multivae_model = MultiVAE(self.dataset)
+        self.item_cnt = self.dataset.item_cnt
+        self.solved_store = SolvedStore.from_matrix(self.encoder.user_encoder, self.dataset.user_item_matrix)
+        self.inference_executor = BatchedInferenceExecutor(self.multivae_model)
+
+    def _load_bundle(self, bundle_path: str) -> None:
+        # Resolved once, so every file comes from the same bundle even if a new one is published meanwhile
+        bundle_path = os.path.realpath(bundle_path)
+        bundle = ServingBundle.load(bundle_path)
+        self.encoder = bundle.encoder
+        self.problem_info = bundle.problem_info
+        self.item_rows = bundle.item_rows
+        self.item_cnt = len(self.encoder.item_encoder.vocabulary)
+        self.solved_store = None
+        if SolvedStore.exists(bundle_path):
+            self.solved_store = SolvedStore.load(self.encoder.user_encoder, bundle_path)
+        self.lightgcn_model = None
+        self.multivae_model = MultiVAE(None, item_cnt=self.item_cnt)
+        self.multivae_model.load_state_dict(bundle.multivae_state_dict)
+        self.multivae_model.eval()
+        if self.quantize:
+            quantize_multivae(self.multivae_model)
+        self.inference_executor = BatchedInferenceExecutor(self.multivae_model)
+        self.lightgcn_item_embedding = torch.from_numpy(bundle.item_embedding)
+        self.lightgcn_layers = bundle.lightgcn_layers
+        self._set_model_version(bundle.version)
+        self.item_neighbours = ItemNeighbours.load_or_build(
+            lambda: self.lightgcn_item_embedding, bundle_path, bundle.version)
 
-    def train_model(self, model_type: str) -> None:
+    def export_bundle(self, bundle_path: str) -> None:
+        """Write a serving bundle from the currently loaded models.
+
+        The bundle is written to a new directory and bundle_path is then switched to it,
+        so running workers never see a partial bundle nor have their memory-mapped files rewritten.
+        """
+        if self.quantize:
+            raise RuntimeError("Serving bundles must be exported from fp32 models.")
+        with torch.no_grad():
+            self.lightgcn_model.eval()
+            _, item_embedding = self.lightgcn_model.get_embeddings()
+        bundle = ServingBundle(
+            self.model_version,
+            self.encoder,
+            self.multivae_model.state_dict(),
+            item_embedding.to('cpu').numpy(),
+            self.problem_info,
+            self.item_rows,
+            self.lightgcn_model.n_layers,
+        )
+        version_path = ServingBundle.make_version_dir(bundle_path, bundle.version)
+        try:
+            self.solved_store.save(version_path)
+            ItemNeighbours.build(item_embedding).save(version_path, bundle.version)
+            # Meta is written last by the bundle itself
+            bundle.save(version_path)
+        except BaseException:
+            shutil.rmtree(version_path, ignore_errors=True)
+            raise
+        ServingBundle.publish(version_path, bundle_path)
+
+    def train_model(self, model_type: str, lightgcn_mode: str = 'full', checkpoint_path: str = None,
+                    epochs: int = None, num_threads: int = None) -> None:
+        """
+        With checkpoint_path, training is checkpointed every epoch and resumed from the checkpoint if one exists
+        and was saved for the same interactions. The checkpoint is removed once training finishes.
+        epochs defaults to the trainer's own epoch count.
+        """
+        fingerprint = f'{self.dataset_key}-{model_type}'
         if model_type == 'LightGCN':
-            trainer = LightGCNTrainer(self.dataset, self.lightgcn_model)
-            trainer.train()
+            trainer = LightGCNTrainer(self.dataset, self.lightgcn_model, mode=lightgcn_mode)
+            epochs = epochs or 10
+            fingerprint = f'{fingerprint}-{self.lightgcn_model.n_layers}'
         elif model_type == 'MultiVAE':
             trainer = MultiVAETrainer(self.dataset, self.multivae_model)
-            trainer.train()
+            epochs = epochs or 60
+        if checkpoint_path is None:
+            pin_threads(num_threads=num_threads)
+            trainer.train(epochs)
+        else:
+            TrainingRunner(trainer, checkpoint_path, epochs, num_threads=num_threads, fingerprint=fingerprint).run()
+
+    def add_interactions(self, interactions: pd.DataFrame) -> pd.DataFrame:
+        """Fold new solved problems into the models without retraining.
+
+        interactions has raw 'user_id' (handle) and 'item_id' (problem id) columns.
+        Unknown handles get new user ids and fold-in LightGCN embeddings, unknown problems are skipped,
+        and so are pairs already in the dataset or repeated within interactions.
+        The fold-in only lasts as long as the process: append the returned interactions to the csv
+        and save the LightGCN model, whose vocabularies are saved with it, to keep it.
+
+        Returns
+        -------
+        pd.DataFrame
+            Raw interactions that were folded in, each pair once and none already in the csv
+        """
+        if self.is_serving:
+            raise RuntimeError("Interactions of a serving recommender are fixed by its bundle.")
+        interactions = interactions[self.encoder.item_encoder.transform(interactions['item_id'].values) >= 0]
+        self.encoder.user_encoder.extend(interactions['user_id'].values)
+        # Every handle is known now, so rows of encoded line up with rows of interactions
+        encoded = self.encoder.transform(interactions)
+        user_ids, item_ids = encoded['user_id'].values, encoded['item_id'].values
+        is_new = ~encoded.duplicated(['user_id', 'item_id']).values
+        is_known_user = user_ids < self.dataset.user_cnt
+        is_new[is_known_user] &= np.asarray(
+            self.dataset.user_item_matrix[user_ids[is_known_user], item_ids[is_known_user]]).ravel() == 0
+        interactions, encoded = interactions[is_new], encoded[is_new]
+        if len(encoded) == 0:
+            return interactions
+        self.dataset = self.dataset.append_interactions(encoded)
+        self.lightgcn_model.fold_in(self.dataset)
+        self.multivae_model.dataset = self.dataset
+        self.solved_store = SolvedStore.from_matrix(self.encoder.user_encoder, self.dataset.user_item_matrix)
+        # Solved sets of the affected handles changed, cached rankings are keyed by solved sets already
+        self.solved_set_cache.clear()
+        self.item_neighbours = None
+        # Propagated embeddings changed, so bundles exported from now on must not reuse the old neighbour tables
+        appended = np.ascontiguousarray(encoded[['user_id', 'item_id']].values).tobytes()
+        digest = hashlib.sha1(self.model_version.encode())
+        digest.update(appended)
+        self._set_model_version(digest.hexdigest()[:16])
+        # Checkpoints of the interactions before the fold-in must not be resumed either
+        self.dataset_key = hashlib.sha1(self.dataset_key.encode() + appended).hexdigest()[:16]
+        return interactions
 
     def save_model(self, model_path: str, model_type: str) -> None:
+        """Save the weights, and the vocabularies next to them, since weights only hold for the codes they were trained on."""
         if model_type == 'LightGCN':
             model = self.lightgcn_model
         elif model_type == 'MultiVAE':
             model = self.multivae_model
         torch.save(model.state_dict(), model_path)
+        self.encoder.save(os.path.dirname(model_path))
 
     def load_model(self, model_path: str, model_type: str) -> None:
+        if self.is_serving:
+            raise RuntimeError("Models of a serving recommender are loaded from its bundle.")
         if model_type == 'LightGCN':
             self.lightgcn_model.load_state_dict(torch.load(model_path, weights_only=True, map_location=torch.device('cpu')))
             self.lightgcn_model.eval()
+            # The depth is stored with the weights
+            self.lightgcn_layers = self.lightgcn_model.n_layers
         elif model_type == 'MultiVAE':
+            if self.quantize:
+                # Quantized layers cannot load fp32 weights, so the model is rebuilt from scratch
+                self.multivae_model = MultiVAE(self.dataset)
+                self.inference_executor.model = self.multivae_model
             self.multivae_model.load_state_dict(torch.load(model_path, weights_only=True, map_location=torch.device('cpu')))
             self.multivae_model.eval()
+            if self.quantize:
+                quantize_multivae(self.multivae_model)
+        self._update_model_version(model_path, model_type)
+        if model_type == 'LightGCN':
+            # Neighbour table files sit next to the weights and are rebuilt only when the weights change
+            self.item_neighbours = ItemNeighbours.load_or_build(
+                lambda: ItemNeighbours.propagated_item_embedding(self.lightgcn_model),
+                os.path.dirname(model_path), self._model_versions[model_type][:16])
 
-    def get_recommended_problems(self, user_handle: str) -> list:
-        downloader = DataDownloader()
+    def _update_model_version(self, model_path: str, model_type: str) -> None:
+        # Workers loading the same weights share the same version, hence the same redis entries
+        with open(model_path, 'rb') as f:
+            self._model_versions[model_type] = hashlib.sha1(f.read()).hexdigest()
+        versions = ','.join(f'{k}={v}' for k, v in sorted(self._model_versions.items()))
+        self._set_model_version(hashlib.sha1(versions.encode()).hexdigest()[:16])
+
+    def _set_model_version(self, version: str) -> None:
+        # Quantized rankings differ slightly, they must not be shared with fp32 workers
+        self.model_version = version
+        self.recommendation_cache.set_model_version(f'{version}-int8' if self.quantize else version)
+
+    def get_solved_set(self, user_handle: str) -> SolvedSet:
+        solved_set = self.solved_set_cache.get(user_handle)
+        if solved_set is not None:
+            return solved_set
         try:
-            problems = downloader.get_top_100_problems(user_handle)
-        except requests.exceptions.HTTPError as e:
+            # Served from the shared cache, only a miss waits for solved.ac
+            problem_ids = self.top_100_cache.get(user_handle)
+            is_fetched = problem_ids is not None
+            error = f"{user_handle} is not a solved.ac handle"
+        except httpx.HTTPError as e:
+            problem_ids = None
+            is_fetched = False
+            error = e
+        # Handles of the interaction snapshot keep their full solved history, on top of what they solved since
+        stored_ids = self.solved_store.get(user_handle) if self.solved_store is not None else None
+        if problem_ids is None and stored_ids is None:
             if user_handle in self.top_100_info:
-                problems = self.top_100_info[user_handle]
+                problem_ids = [problem['problemId'] for problem in self.top_100_info[user_handle]]
                 print(f"Using cached top 100 problems for {user_handle}.")
             else:
-                problems = []
-                print(f"Error fetching top 100 problems for {user_handle}: {e}")
-            
-        solved_ids = []
-        for problem in problems:
-            solved_ids.append(problem['problemId'])
-        if solved_ids:
-            solved_ids = self.encoder.item_encoder.transform(np.array(solved_ids).reshape(-1, 1)).ravel()
-            solved_ids = [id for id in solved_ids if id >= 0]
-        is_solved = np.zeros(self.multivae_model.dataset.item_cnt)
-        is_solved[solved_ids] = 1
-        is_solved = torch.tensor(is_solved, dtype=torch.float32).unsqueeze(0)
-        scores, _, _ = self.multivae_model.forward(is_solved)
-        scores = scores.squeeze().to('cpu').detach().numpy()
-        mask = np.zeros_like(scores, dtype=bool)
-        mask[solved_ids] = True
-        scores[mask] = -np.inf
-        sorted_problem_ids = np.argsort(scores)[::-1]
-        sorted_problem_ids = self.encoder.item_encoder.inverse_transform(sorted_problem_ids.reshape(-1, 1)).ravel()
-        sorted_df = self.problem_info.set_index('problemId', drop=True).loc[sorted_problem_ids].reset_index()
-        return sorted_df
-
-    def get_similar_problems(self, problem_id: int) -> list:
-        problem_id = self.encoder.item_encoder.transform(np.array([problem_id]).reshape(-1, 1)).item()
+                problem_ids = []
+                print(f"Error fetching top 100 problems for {user_handle}: {error}")
+        elif problem_ids is None:
+            print(f"Using the interaction snapshot for {user_handle}: {error}")
+
+        solved_ids = np.empty(0, dtype=int)
+        if problem_ids:
+            solved_ids = np.array(problem_ids)
+            solved_ids = self.encoder.item_encoder.transform(solved_ids)
+            solved_ids = solved_ids[solved_ids >= 0]
+        if stored_ids is not None:
+            solved_ids = np.union1d(solved_ids, stored_ids)
+        solved_set = SolvedSet.from_ids(solved_ids, self.item_cnt)
+        # Failed fetches and unknown handles are not cached here, the latter are negatively cached in top_100_cache
+        if is_fetched:
+            self.solved_set_cache.set(user_handle, solved_set)
+        return solved_set
+
+    def get_recommended_problems(self, user_handle: str) -> RankedProblems:
+        solved_ids = self.get_solved_set(user_handle).ids()
+        cache_key = self.recommendation_cache.key(user_handle, solved_ids)
+        topk_ids = self.recommendation_cache.get(cache_key)
+        if topk_ids is None:
+            topk_ids = self._compute_recommended_ids(solved_ids)
+            self.recommendation_cache.set(cache_key, topk_ids)
+        # Filters too narrow for the cached prefix are served from a full scoring pass
+        return RankedProblems.from_order(topk_ids, self.item_cnt, self.problem_info, self.item_rows,
+                                         scores_fn=lambda: self._compute_scores(solved_ids),
+                                         valid_cnt=self.item_cnt - len(solved_ids))
+
+    def _compute_scores(self, solved_ids: np.ndarray) -> np.ndarray:
+        # Concurrent calls from other request threads are batched into the same forward pass
+        scores = self.inference_executor.submit(solved_ids).result()
+        # Solved problems are never recommended
+        scores[solved_ids] = -np.inf
+        return scores
+
+    def _compute_recommended_ids(self, solved_ids: np.ndarray) -> np.ndarray:
+        scores = self._compute_scores(solved_ids)
+        return RankedProblems(scores, self.problem_info, self.item_rows).top(self.cache_topk).astype(np.int32)
+
+    def get_similar_problems(self, problem_id: int) -> RankedProblems:
+        problem_id = self.encoder.item_encoder.transform([problem_id])[0]
         if problem_id < 0:
             raise ValueError("Problem ID not found in the dataset.")
-        target_embedding = self.lightgcn_model.item_embedding.weight[problem_id].unsqueeze(0)
-        all_embeddings = self.lightgcn_model.item_embedding.weight
-        similarities = torch.nn.functional.cosine_similarity(target_embedding, all_embeddings)
-        similarities = similarities.cpu().detach().numpy()
-        sorted_problem_ids = np.argsort(similarities)[::-1]
-        sorted_problem_ids = self.encoder.item_encoder.inverse_transform(sorted_problem_ids.reshape(-1, 1)).ravel()
-        sorted_df = self.problem_info.set_index('problemId', drop=True).loc[sorted_problem_ids].reset_index()
-        return sorted_df
-    
-    def get_other_user_problems(self, recommended_problems: pd.DataFrame, base_user_handle: str, target_user_handle: str) -> list:
-        downloader = DataDownloader()
-        try:
-            base_user_problems = downloader.get_top_100_problems(base_user_handle)
-            target_user_problems = downloader.get_top_100_problems(target_user_handle)
-        except requests.exceptions.HTTPError as e:
-            if base_user_handle in self.top_100_info:
-                base_user_problems = self.top_100_info[base_user_handle]
-            else:
-                base_user_problems = []
-            if target_user_handle in self.top_100_info:
-                target_user_problems = self.top_100_info[target_user_handle]
-            else:
-                target_user_problems = []
-        base_problem_ids = {problem['problemId'] for problem in base_user_problems}
-        target_problem_ids = {problem['problemId'] for problem in target_user_problems}
-        other_problem_ids = list(target_problem_ids - base_problem_ids)
-        other_problem_ids = [id for id in other_problem_ids if id >= 0]
-        other_user_problems = self.problem_info.set_index('problemId', drop=True).loc[other_problem_ids].reset_index()
-        sorted_df = recommended_problems[recommended_problems['problemId'].isin(other_user_problems['problemId'])].copy()
-        return sorted_df
+        if self.item_neighbours is None:
+            self.item_neighbours = ItemNeighbours.build(ItemNeighbours.propagated_item_embedding(self.lightgcn_model))
+        return SimilarProblems(self.item_neighbours, problem_id, self.problem_info, self.item_rows)
+
+    def get_other_user_problems(self, recommended_problems: RankedProblems, base_user_handle: str, target_user_handle: str) -> RankedProblems:
+        other_problems = self.get_solved_set(target_user_handle) - self.get_solved_set(base_user_handle)
+        return recommended_problems.restrict(other_problems.mask())
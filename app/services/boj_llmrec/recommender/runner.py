@@ -0,0 +1,178 @@
+import os
+import copy
+import multiprocessing
+import torch
+from typing import Callable
+from concurrent.futures import ProcessPoolExecutor
+
+from .utils import atomic_write
+
+def pin_threads(cores: list[int] = None, num_threads: int = None) -> None:
+    """Restrict the process to the given cores and size torch's intra-op pool to match.
+
+    Parameters
+    ----------
+    cores : list[int]
+        CPU ids the process may run on, unchanged if None or unsupported by the platform
+    num_threads : int
+        Number of intra-op threads, the number of cores if None
+    """
+    if cores is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cores)
+    if num_threads is None and cores is not None:
+        num_threads = len(cores)
+    if num_threads is not None:
+        torch.set_num_threads(num_threads)
+
+class TrainingRunner:
+    """
+    Runs a trainer epoch by epoch with checkpoints, resumption and early stopping.
+
+    The trainer must provide `model`, `optimizer`, `validate_every`, `train_epoch(epoch, has_next)`
+    and `validate() -> dict`, as LightGCNTrainer and MultiVAETrainer do.
+    `cancel_prefetch()` is called on early stopping when the trainer provides it.
+    A checkpoint holds the model and optimizer states, the next epoch and the best weights so far,
+    so an interrupted run resumes where its last checkpoint left off.
+    It is removed once the run finishes, so the next run trains from scratch.
+    """
+
+    def __init__(self, trainer, checkpoint_path: str, max_epochs: int, checkpoint_every: int = 1,
+                 patience: int = None, metric: str = 'recall@10', cores: list[int] = None, num_threads: int = None,
+                 fingerprint: str = None) -> None:
+        """
+        patience: number of validations without improvement of `metric` before stopping, never stops early if None.
+        cores, num_threads: see pin_threads.
+        fingerprint: identifies the data and configuration trained on, a checkpoint of another one is never resumed.
+            Defaults to the shape of the training data.
+        """
+        self.trainer = trainer
+        self.checkpoint_path = checkpoint_path
+        self.max_epochs = max_epochs
+        self.checkpoint_every = checkpoint_every
+        self.patience = patience
+        self.metric = metric
+        self.cores = cores
+        self.num_threads = num_threads
+        if fingerprint is None:
+            dataset = trainer.dataset
+            fingerprint = f'{dataset.user_cnt}x{dataset.item_cnt}x{dataset.interaction_cnt}'
+        self.fingerprint = fingerprint
+
+        self.epoch = 0
+        self.best_metric = None
+        self.best_epoch = None
+        self.best_state = None
+        self.stale_cnt = 0
+
+    def save_checkpoint(self) -> None:
+        checkpoint = {
+            'epoch': self.epoch,
+            'model': self.trainer.model.state_dict(),
+            'optimizer': self.trainer.optimizer.state_dict(),
+            'best_metric': self.best_metric,
+            'best_epoch': self.best_epoch,
+            'best_model': self.best_state,
+            'stale_cnt': self.stale_cnt,
+            'fingerprint': self.fingerprint,
+        }
+        # Written under a temporary name, so an interruption never leaves a partial checkpoint
+        atomic_write(self.checkpoint_path, lambda f: torch.save(checkpoint, f))
+
+    def load_checkpoint(self) -> bool:
+        if not os.path.exists(self.checkpoint_path):
+            return False
+        checkpoint = torch.load(self.checkpoint_path, weights_only=True, map_location=torch.device('cpu'))
+        if checkpoint.get('fingerprint') != self.fingerprint:
+            print(f'Ignoring {self.checkpoint_path}, it was saved for other data or configuration')
+            return False
+        self.trainer.model.load_state_dict(checkpoint['model'])
+        self.trainer.model.to(self.trainer.device)
+        self.trainer.optimizer.load_state_dict(checkpoint['optimizer'])
+        self.epoch = checkpoint['epoch']
+        self.best_metric = checkpoint['best_metric']
+        self.best_epoch = checkpoint['best_epoch']
+        self.best_state = checkpoint['best_model']
+        self.stale_cnt = checkpoint['stale_cnt']
+        print(f'Resuming from epoch {self.epoch} of {self.checkpoint_path}')
+        return True
+
+    def _is_stopping(self) -> bool:
+        return self.patience is not None and self.stale_cnt >= self.patience
+
+    def run(self) -> dict:
+        """Train until max_epochs or early stopping, leaving the best validated weights in the model.
+
+        Returns
+        -------
+        dict
+            {'epochs': number of epochs trained, 'best_epoch', 'best_metric'}
+        """
+        pin_threads(self.cores, self.num_threads)
+        self.load_checkpoint()
+        can_validate = self.trainer.dataset.test_interactions is not None
+
+        while self.epoch < self.max_epochs and not self._is_stopping():
+            self.trainer.train_epoch(self.epoch, has_next=self.epoch + 1 < self.max_epochs)
+            self.epoch += 1
+
+            if can_validate and self.epoch % self.trainer.validate_every == 0:
+                value = self.trainer.validate()[self.metric]
+                if self.best_metric is None or value > self.best_metric:
+                    self.best_metric, self.best_epoch, self.stale_cnt = value, self.epoch, 0
+                    self.best_state = copy.deepcopy(self.trainer.model.state_dict())
+                else:
+                    self.stale_cnt += 1
+
+            is_stopping = self._is_stopping()
+            if is_stopping or self.epoch % self.checkpoint_every == 0 or self.epoch == self.max_epochs:
+                self.save_checkpoint()
+            if is_stopping:
+                if hasattr(self.trainer, 'cancel_prefetch'):
+                    self.trainer.cancel_prefetch()
+                print(f'Early stopping at epoch {self.epoch}, best epoch {self.best_epoch}: {self.best_metric}')
+                break
+
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+        if self.best_state is not None:
+            self.trainer.model.load_state_dict(self.best_state)
+        return {'epochs': self.epoch, 'best_epoch': self.best_epoch, 'best_metric': self.best_metric}
+
+def _init_worker(core_queue) -> None:
+    # Every worker takes its own slice of cores for its whole lifetime
+    pin_threads(core_queue.get())
+
+def run_parallel(train_fn: Callable[[dict], dict], configs: list[dict], num_workers: int,
+                 cores: list[int] = None) -> list[dict]:
+    """Run train_fn once per configuration in worker processes with disjoint cores.
+
+    Parameters
+    ----------
+    train_fn : Callable[[dict], dict]
+        Module-level function training one configuration, e.g. with a TrainingRunner per config
+    configs : list[dict]
+        Hyperparameter configurations
+    num_workers : int
+        Number of configurations trained at once
+    cores : list[int]
+        CPU ids shared out between workers, every available core if None
+
+    Returns
+    -------
+    list[dict]
+        Results of train_fn, in the order of configs
+    """
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else list(range(os.cpu_count()))
+    num_workers = max(1, min(num_workers, len(configs), len(cores)))
+    # Spawned workers, since forking a process with initialized torch thread pools is unsafe
+    context = multiprocessing.get_context('spawn')
+    core_queue = context.Queue()
+    chunk_size, remainder = divmod(len(cores), num_workers)
+    for i in range(num_workers):
+        # Contiguous chunks, the first `remainder` workers take one core more
+        start = i * chunk_size + min(i, remainder)
+        core_queue.put(cores[start:start + chunk_size + (i < remainder)])
+    with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                             initializer=_init_worker, initargs=(core_queue,)) as executor:
+        return list(executor.map(train_fn, configs))
@@ -1,28 +1,84 @@
+import threading
 import numpy as np
-import pandas as pd
 import torch
-from tqdm import tqdm
+from concurrent.futures import Future
 from scipy.sparse import csr_matrix
 
 from .dataset import Dataset
 
 class NegativeSampler:
-    def __init__(self, dataset: Dataset, sample_num_per_user: int, negative_sample_num: int) -> None:
+    def __init__(self, dataset: Dataset, sample_num_per_user: int, negative_sample_num: int,
+                 seed: int = None, max_rejection_rounds: int = 100) -> None:
         self.dataset = dataset
         self.sample_num_per_user = sample_num_per_user
         self.negative_sample_num = negative_sample_num
+        self.max_rejection_rounds = max_rejection_rounds
+        self.rng = np.random.default_rng(seed)
+
+        adj: csr_matrix = self.dataset.user_item_matrix
+        self.indptr = adj.indptr.astype(np.int64)
+        self.indices = adj.indices.astype(np.int64)
+        # Sorted (user, item) keys, membership is tested by binary search
+        users = np.repeat(np.arange(self.dataset.user_cnt, dtype=np.int64), np.diff(self.indptr))
+        self.positive_keys = np.sort(users * self.dataset.item_cnt + self.indices)
+
+    def _is_positive(self, users: np.ndarray, items: np.ndarray) -> np.ndarray:
+        keys = users * self.dataset.item_cnt + items
+        positions = np.minimum(np.searchsorted(self.positive_keys, keys), len(self.positive_keys) - 1)
+        return self.positive_keys[positions] == keys
 
     def get_samples(self) -> torch.Tensor:
-        pairwise_samples = []
-
-        for user in tqdm(range(self.dataset.user_cnt)):
-            adj: csr_matrix = self.dataset.user_item_matrix
-            all_items = np.arange(self.dataset.item_cnt)
-            positive_items = adj.indices[adj.indptr[user]: adj.indptr[user + 1]]
-            negative_items = np.setdiff1d(all_items, positive_items)
-
-            for _ in range(self.sample_num_per_user):
-                cur_positive_item = np.random.choice(positive_items)
-                cur_negative_items = np.random.choice(negative_items, size=self.negative_sample_num)
-                pairwise_samples.append([user, cur_positive_item, *cur_negative_items])
-        return torch.tensor(pairwise_samples, dtype=torch.long)
+        """Get [user, positive item, *negative items] rows, sample_num_per_user rows per user.
+
+        Rows whose negatives still hit a positive item after max_rejection_rounds redraws are dropped,
+        which only happens to users who solved almost every item.
+        """
+        user_cnt, item_cnt = self.dataset.user_cnt, self.dataset.item_cnt
+        sample_cnt = user_cnt * self.sample_num_per_user
+        samples = torch.empty((sample_cnt, 2 + self.negative_sample_num), dtype=torch.long)
+        pairwise_samples = samples.numpy()
+
+        users = np.repeat(np.arange(user_cnt, dtype=np.int64), self.sample_num_per_user)
+        pairwise_samples[:, 0] = users
+
+        # Positive items: one random offset within each user's CSR range
+        starts = self.indptr[users]
+        degrees = self.indptr[users + 1] - starts
+        offsets = (self.rng.random(sample_cnt) * degrees).astype(np.int64)
+        pairwise_samples[:, 1] = self.indices[starts + offsets]
+
+        # Negative items: draw uniformly, redraw the ones hitting a positive item
+        negative_users = np.repeat(users, self.negative_sample_num)
+        negatives = self.rng.integers(0, item_cnt, size=len(negative_users))
+        rejected = np.flatnonzero(self._is_positive(negative_users, negatives))
+        for _ in range(self.max_rejection_rounds):
+            if len(rejected) == 0:
+                break
+            negatives[rejected] = self.rng.integers(0, item_cnt, size=len(rejected))
+            rejected = rejected[self._is_positive(negative_users[rejected], negatives[rejected])]
+        pairwise_samples[:, 2:] = negatives.reshape(sample_cnt, self.negative_sample_num)
+        if len(rejected):
+            keep = np.ones(sample_cnt, dtype=bool)
+            keep[rejected // self.negative_sample_num] = False
+            print(f'Dropping {sample_cnt - keep.sum()} samples without a true negative '
+                  f'after {self.max_rejection_rounds} redraws')
+            samples = samples[torch.from_numpy(keep)]
+        return samples
+
+    def get_samples_async(self) -> Future:
+        """Generate samples on a background thread, e.g. for the next epoch while the current one trains.
+
+        The thread is a daemon, so samples nobody waits for anymore never delay the exit of the process.
+        """
+        future = Future()
+
+        def run() -> None:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self.get_samples())
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name='negative-sampler', daemon=True).start()
+        return future
@@ -0,0 +1,74 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+class SolvedSet:
+    """
+    Set of encoded item ids packed as a bitset.
+
+    Set algebra is done with bitwise ops over the packed bytes,
+    and `mask` unpacks it as a boolean mask over the score array.
+    """
+
+    def __init__(self, bits: np.ndarray, item_cnt: int) -> None:
+        self.bits = bits
+        self.item_cnt = item_cnt
+
+    @classmethod
+    def from_ids(cls, item_ids: np.ndarray, item_cnt: int) -> 'SolvedSet':
+        mask = np.zeros(item_cnt, dtype=bool)
+        mask[np.asarray(item_ids, dtype=np.int64)] = True
+        return cls(np.packbits(mask), item_cnt)
+
+    def __and__(self, other: 'SolvedSet') -> 'SolvedSet':
+        return SolvedSet(self.bits & other.bits, self.item_cnt)
+
+    def __or__(self, other: 'SolvedSet') -> 'SolvedSet':
+        return SolvedSet(self.bits | other.bits, self.item_cnt)
+
+    def __sub__(self, other: 'SolvedSet') -> 'SolvedSet':
+        return SolvedSet(self.bits & ~other.bits, self.item_cnt)
+
+    def __len__(self) -> int:
+        return int(np.count_nonzero(self.mask()))
+
+    def mask(self) -> np.ndarray:
+        return np.unpackbits(self.bits, count=self.item_cnt).view(bool)
+
+    def ids(self) -> np.ndarray:
+        return np.flatnonzero(self.mask())
+
+class SolvedSetCache:
+    """
+    In-process LRU of solved sets per handle, with expiration.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl_sec: int = 600) -> None:
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+        self._entries: OrderedDict[str, tuple[float, SolvedSet]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, handle: str) -> SolvedSet | None:
+        with self._lock:
+            entry = self._entries.get(handle)
+            if entry is None:
+                return None
+            expire_at, solved_set = entry
+            if expire_at <= time.monotonic():
+                del self._entries[handle]
+                return None
+            self._entries.move_to_end(handle)
+            return solved_set
+
+    def set(self, handle: str, solved_set: SolvedSet) -> None:
+        with self._lock:
+            self._entries[handle] = (time.monotonic() + self.ttl_sec, solved_set)
+            self._entries.move_to_end(handle)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,50 @@
+import os
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from .encoder import IdEncoder
+from .utils import atomic_write
+
+class SolvedStore:
+    """
+    Solved items of every handle of the interaction snapshot, stored CSR-style.
+
+    Rows follow the user encoder, so a handle is looked up by encoding it,
+    then its encoded item ids are indices[indptr[row]:indptr[row + 1]].
+    Loaded arrays are memory-mapped and shared between workers through the page cache.
+    """
+
+    INDPTR_FILE = 'solved_indptr.npy'
+    INDICES_FILE = 'solved_indices.npy'
+
+    def __init__(self, user_encoder: IdEncoder, indptr: np.ndarray, indices: np.ndarray) -> None:
+        self.user_encoder = user_encoder
+        self.indptr = indptr
+        self.indices = indices
+
+    @classmethod
+    def from_matrix(cls, user_encoder: IdEncoder, user_item_matrix: csr_matrix) -> 'SolvedStore':
+        return cls(user_encoder, user_item_matrix.indptr.astype(np.int64), user_item_matrix.indices.astype(np.int32))
+
+    def save(self, dir_path: str) -> None:
+        # Replaced rather than overwritten, since workers may have the current files memory-mapped
+        for filename, array in [(SolvedStore.INDPTR_FILE, self.indptr), (SolvedStore.INDICES_FILE, self.indices)]:
+            atomic_write(os.path.join(dir_path, filename), lambda f: np.save(f, array))
+
+    @staticmethod
+    def exists(dir_path: str) -> bool:
+        return all(os.path.exists(os.path.join(dir_path, filename))
+                   for filename in [SolvedStore.INDPTR_FILE, SolvedStore.INDICES_FILE])
+
+    @classmethod
+    def load(cls, user_encoder: IdEncoder, dir_path: str) -> 'SolvedStore':
+        indptr = np.load(os.path.join(dir_path, SolvedStore.INDPTR_FILE), mmap_mode='r')
+        indices = np.load(os.path.join(dir_path, SolvedStore.INDICES_FILE), mmap_mode='r')
+        return cls(user_encoder, indptr, indices)
+
+    def get(self, handle: str) -> np.ndarray | None:
+        """Get encoded item ids solved by the handle, None if the handle is unknown."""
+        row = self.user_encoder.transform([handle])[0]
+        if row < 0:
+            return None
+        return self.indices[self.indptr[row]:self.indptr[row + 1]]
@@ -1,28 +1,74 @@
 import numpy as np
 import pandas as pd
+from scipy.sparse import csr_matrix
 
 class Splitter:
-    
-    def leave_n_out_split(self, interactions: pd.DataFrame, n: int = 20, is_random: bool = True) -> tuple[pd.DataFrame, pd.DataFrame]:
-        grouped = interactions.groupby('user_id')
-        train_users, train_items = [], []
-        test_users, test_items = [], []
-
-        for user, group in grouped:
-            item_indices = group['item_id'].values
-            if len(item_indices) <= n:
-                continue
-            if is_random:
-                test_indices = np.random.choice(item_indices, replace=False, size=n)
-            else:
-                test_indices = item_indices[-n:]
-            train_indices = list(set(item_indices) - set(test_indices))
-
-            train_users.extend([user] * len(train_indices))
-            test_users.extend([user] * len(test_indices))
-            train_items.extend(train_indices)
-            test_items.extend(test_indices)
-
-        train_interactions = pd.DataFrame({'user_id': train_users, 'item_id': train_items})
-        test_interactions = pd.DataFrame({'user_id': test_users, 'item_id': test_items})
+
+    def leave_n_out_split(self, interactions: pd.DataFrame, n: int = 20, is_random: bool = True,
+                          seed: int = None, time_column: str = None) -> tuple[pd.DataFrame, pd.DataFrame]:
+        """Hold out n interactions of every user with more than n interactions.
+
+        Parameters
+        ----------
+        interactions : pd.DataFrame
+            Interactions with 'user_id' and 'item_id' columns
+        n : int
+            Number of test interactions per user, users with n or fewer interactions are dropped
+        is_random : bool
+            Whether test interactions are drawn at random, otherwise the latest n are held out
+        seed : int
+            Seed of the random draw
+        time_column : str
+            Column ordering interactions in time for the temporal split, row order if None
+        """
+        frame, is_test = self._split(interactions, n, is_random, seed, time_column)
+        train_interactions = frame.loc[~is_test, ['user_id', 'item_id']].reset_index(drop=True)
+        test_interactions = frame.loc[is_test, ['user_id', 'item_id']].reset_index(drop=True)
         return train_interactions, test_interactions
+
+    def leave_n_out_split_csr(self, interactions: pd.DataFrame, n: int = 20, is_random: bool = True,
+                              seed: int = None, time_column: str = None,
+                              shape: tuple[int, int] = None) -> tuple[csr_matrix, csr_matrix]:
+        """Same split as leave_n_out_split over encoded interactions, as user-item matrices.
+
+        shape defaults to (max user id + 1, max item id + 1), so rows and columns follow the encoder.
+        """
+        frame, is_test = self._split(interactions, n, is_random, seed, time_column)
+        if shape is None:
+            shape = (int(interactions['user_id'].max()) + 1, int(interactions['item_id'].max()) + 1)
+        user_ids = frame['user_id'].values
+        item_ids = frame['item_id'].values
+        return (self.to_csr(user_ids[~is_test], item_ids[~is_test], shape),
+                self.to_csr(user_ids[is_test], item_ids[is_test], shape))
+
+    @staticmethod
+    def to_csr(user_ids: np.ndarray, item_ids: np.ndarray, shape: tuple[int, int]) -> csr_matrix:
+        data = np.ones(len(user_ids), dtype=np.float32)
+        return csr_matrix((data, (user_ids, item_ids)), shape=shape)
+
+    def _split(self, interactions: pd.DataFrame, n: int, is_random: bool,
+               seed: int, time_column: str) -> tuple[pd.DataFrame, np.ndarray]:
+        """Get interactions of users with more than n interactions, and the mask of test rows."""
+        columns = ['user_id', 'item_id'] + ([time_column] if time_column is not None else [])
+        frame = interactions[columns].drop_duplicates(['user_id', 'item_id'])
+        if is_random:
+            keys = np.random.default_rng(seed).random(len(frame))
+        elif time_column is not None:
+            keys = frame[time_column].values
+        else:
+            keys = np.arange(len(frame))
+
+        # Sort by user, then by key, so the n largest keys of a user are the last n rows of its run
+        user_codes = pd.factorize(frame['user_id'])[0]
+        order = np.lexsort((keys, user_codes))
+        sorted_codes = user_codes[order]
+        starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+        counts = np.diff(np.r_[starts, len(order)])
+        rank_from_end = np.repeat(starts + counts, counts) - np.arange(len(order)) - 1
+        eligible = np.repeat(counts > n, counts)
+
+        keep = np.empty(len(order), dtype=bool)
+        keep[order] = eligible
+        is_test = np.empty(len(order), dtype=bool)
+        is_test[order] = eligible & (rank_from_end < n)
+        return frame[keep], is_test[keep]
@@ -1,4 +1,9 @@
+import os
+import tempfile
+import numpy as np
 import torch
+from typing import Callable, BinaryIO
+from scipy.sparse import csr_matrix
 
 def vae_bce_loss(true: torch.Tensor, pred: torch.Tensor) -> torch.Tensor:
     return -torch.sum(torch.nn.functional.log_softmax(pred, 1) * true, -1)
@@ -9,16 +14,53 @@ def vae_reg_loss(mu: torch.Tensor, log_var: torch.Tensor) -> torch.Tensor:
 def bpr_loss(pos_scores: torch.Tensor, neg_scores: torch.Tensor) -> torch.Tensor:
     return torch.mean(torch.nn.functional.softplus(neg_scores - pos_scores))
 
-def recall(true: list[list], pred: list[list]) -> float:
-    recall = 0
-    nonempty_cnt = 0
-    for p, t in zip(pred, true):
-        if len(t) == 0:
-            continue
-        recall += len(set(p) & set(t)) / len(t)
-        nonempty_cnt += 1
+def atomic_write(path: str, write_fn: Callable[[BinaryIO], None]) -> None:
+    """Write a file under a unique temporary name in its directory, then move it into place.
+
+    Concurrent writers never share a temporary file, and readers, memory-mapped ones included,
+    keep the old file until the rename and never see a partial one.
+    """
+    dir_path, filename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(dir=dir_path or '.', prefix=f'.{filename}.', suffix='.tmp')
     try:
-        recall /= nonempty_cnt
-    except ZeroDivisionError:
-        recall = -1
-    return recall
\ No newline at end of file
+        with os.fdopen(fd, 'wb') as f:
+            write_fn(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def csr_to_sparse_tensor(matrix: csr_matrix) -> torch.Tensor:
+    coo = matrix.tocoo()
+    indices = torch.tensor(np.array([coo.row, coo.col]), dtype=torch.long)
+    values = torch.tensor(coo.data, dtype=torch.float32)
+    return torch.sparse_coo_tensor(indices, values, size=coo.shape).coalesce()
+
+def chunked_topk(score_fn: Callable[[int, int], torch.Tensor], seen: csr_matrix, k: int, chunk_size: int = 1024) -> torch.Tensor:
+    """Get top k items of every user, scoring users chunk by chunk.
+
+    Only one chunk of scores and the k-wide results are alive at once,
+    and seen items are masked by scattering the CSR indices of the chunk.
+
+    Parameters
+    ----------
+    score_fn : Callable[[int, int], torch.Tensor]
+        Returns the scores of users in [start, end) over every item
+    seen : csr_matrix
+        Items to exclude from every user's result
+    k : int
+        Number of items per user
+    chunk_size : int
+        Number of users scored at once
+    """
+    topk = []
+    for start in range(0, seen.shape[0], chunk_size):
+        end = min(start + chunk_size, seen.shape[0])
+        scores = score_fn(start, end)
+        chunk = seen[start:end]
+        rows = torch.from_numpy(np.repeat(np.arange(end - start), np.diff(chunk.indptr))).to(scores.device)
+        cols = torch.from_numpy(chunk.indices.astype(np.int64)).to(scores.device)
+        scores[rows, cols] = -torch.inf
+        topk.append(torch.topk(scores, k=k, dim=1).indices.to('cpu'))
+    return torch.cat(topk)
@@ -0,0 +1,16 @@
+import pandas as pd
+from boj_llmrec.recommender.dataset import Dataset
+from boj_llmrec.recommender.encoder import Encoder
+from boj_llmrec.recommender.splitter import Splitter
+from boj_llmrec.recommender.MultiVAE import MultiVAE, MultiVAETrainer
+from boj_llmrec.recommender.quantization import check_quantization_parity
+
+solved_info = pd.read_csv('data/solved_info.csv', index_col=0)
+solved_info.columns = ['user_id', 'item_id']
+# The saved model was trained on every interaction, so a model is trained on a split for held-out recall
+train, test = Splitter().leave_n_out_split(solved_info, n=20, seed=0)
+encoder = Encoder().fit(train)
+dataset = Dataset(encoder.transform(train), encoder.transform(test), None, None)
+model = MultiVAE(dataset)
+MultiVAETrainer(dataset, model).train()
+print(check_quantization_parity(model, dataset))
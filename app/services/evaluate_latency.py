@@ -0,0 +1,11 @@
+import pandas as pd
+from boj_llmrec.recommender import Recommender
+from boj_llmrec.recommender.evaluation import evaluate_latency
+
+recommender = Recommender(data_path='data', encoder_path='saved')
+recommender.load_model(model_path='saved/LightGCN_model.pth', model_type='LightGCN')
+recommender.load_model(model_path='saved/MultiVAE_model.pth', model_type='MultiVAE')
+# Handles of the snapshot, so their solved sets are taken from it instead of solved.ac
+user_handles = pd.Series(recommender.encoder.user_encoder.vocabulary).sample(200, random_state=0)
+problem_ids = pd.Series(recommender.encoder.item_encoder.vocabulary).sample(200, random_state=0)
+print(evaluate_latency(recommender, user_handles, problem_ids))
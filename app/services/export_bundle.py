@@ -0,0 +1,6 @@
+from boj_llmrec.recommender import Recommender
+
+recommender = Recommender(data_path='data', encoder_path='saved')
+recommender.load_model(model_path='saved/LightGCN_model.pth', model_type='LightGCN')
+recommender.load_model(model_path='saved/MultiVAE_model.pth', model_type='MultiVAE')
+recommender.export_bundle(bundle_path='saved/serving')
@@ -0,0 +1,15 @@
+import pandas as pd
+from boj_llmrec.recommender import Recommender
+
+# Vocabularies saved with the weights, so users folded in by earlier runs keep their ids
+recommender = Recommender(data_path='data', encoder_path='saved')
+recommender.load_model(model_path='saved/LightGCN_model.pth', model_type='LightGCN')
+recommender.load_model(model_path='saved/MultiVAE_model.pth', model_type='MultiVAE')
+# Same layout as solved_info.csv, with the interactions collected since the snapshot
+new_solved_info = pd.read_csv('data/new_solved_info.csv', index_col=0)
+new_solved_info.columns = ['user_id', 'item_id']
+folded = recommender.add_interactions(new_solved_info)
+# The snapshot and the folded weights are kept, so a restart serves the new users too
+folded.to_csv('data/solved_info.csv', mode='a', header=False)
+recommender.save_model(model_path='saved/LightGCN_model.pth', model_type='LightGCN')
+recommender.export_bundle(bundle_path='saved/serving')
@@ -4,9 +4,10 @@ import json
 import pandas as pd
 from sqlmodel.ext.asyncio.session import AsyncSession
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from app.core.configuration import settings
-from app.core.redis import get_redis_client # Redis 활용하여 최적화
+from app.core.redis import get_redis_client, get_sync_redis_client # Redis 활용하여 최적화
 from app.crud import conversation as crud_conv
 from app.crud import message as crud_msg
 from app.schemas.user import UserOut
@@ -28,7 +29,11 @@ def _session_key(conv_id: str) -> str:
 def initialize_llmrec_instance():
     global _global_llmrec_instance
     if _global_llmrec_instance is None:
-        _global_llmrec_instance = LLMRec(api_key=settings.LLM_API_KEY)
+        _global_llmrec_instance = LLMRec(
+            api_key=settings.LLM_API_KEY,
+            redis_client=get_sync_redis_client(),
+            quantize=settings.RECOMMENDER_QUANTIZE
+        )
         print("[LLM Service] Global LLMRec instance initialized.")
     return _global_llmrec_instance
 
@@ -136,7 +141,8 @@ async def get_stateless_llm_summary(
     print(messages_for_llm)
 
     try:
-        summary_response_text, _, _, _ = llmrec_instance.llm.chat(
+        summary_response_text, _, _, _ = await run_in_threadpool(
+            llmrec_instance.llm.chat,
             user_input=messages_for_llm[1]["content"],
             prev_msgs=[messages_for_llm[0]],
             user_handle=user_handle,
@@ -207,7 +213,8 @@ async def generate_response(
     LLM 응답 생성 및 반환, 세션 갱신(dict)
     """
     session = await get_llm_session(conv_id, user_handle, db_session)
-    text_response, speech_response, keywords = session.chat(message)
+    # 추천 모델 추론과 OpenAI 호출이 event loop를 막지 않도록 threadpool에서 실행
+    text_response, speech_response, keywords = await run_in_threadpool(session.chat, message)
     
     # 대화 제목 생성
     conversation = await crud_conv.get_conversation(db_session, conv_id)
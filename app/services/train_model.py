@@ -1,6 +1,11 @@
 from boj_llmrec.recommender import Recommender
 
 model_type = 'LightGCN'  # or 'MultiVAE'
-recommender = Recommender(data_path='data')
-recommender.train_model(model_type=model_type)
-recommender.save_model(model_path=f'saved/{model_type}_model.pth', model_type=model_type)
\ No newline at end of file
+# Saved with the LightGCN weights, so serving propagates with the same depth
+lightgcn_layers = 1
+# Codes of the saved vocabularies are kept, so the other model's weights stay valid.
+# Problems new to them are only picked up once they are removed and both models are retrained
+recommender = Recommender(data_path='data', encoder_path='saved', lightgcn_layers=lightgcn_layers)
+# Rerunning after an interruption resumes from the last checkpoint
+recommender.train_model(model_type=model_type, checkpoint_path=f'saved/{model_type}_checkpoint.pth')
+recommender.save_model(model_path=f'saved/{model_type}_model.pth', model_type=model_type)
@@ -0,0 +1,29 @@
+import itertools
+import pandas as pd
+from boj_llmrec.recommender.dataset import Dataset
+from boj_llmrec.recommender.encoder import Encoder
+from boj_llmrec.recommender.splitter import Splitter
+from boj_llmrec.recommender.runner import TrainingRunner, run_parallel
+from boj_llmrec.recommender.LightGCN import LightGCN, LightGCNTrainer
+
+def load_dataset() -> Dataset:
+    solved_info = pd.read_csv('data/solved_info.csv', index_col=0)
+    solved_info.columns = ['user_id', 'item_id']
+    train, test = Splitter().leave_n_out_split(solved_info, n=20, seed=0)
+    encoder = Encoder().fit(train)
+    return Dataset(encoder.transform(train), encoder.transform(test), None, None)
+
+def train_config(config: dict) -> dict:
+    dataset = load_dataset()
+    model = LightGCN(dataset, n_layers=config['n_layers'])
+    trainer = LightGCNTrainer(dataset, model, mode=config['mode'], lr=config['lr'], seed=0)
+    checkpoint_path = f"saved/tune_LightGCN_{config['n_layers']}_{config['mode']}_{config['lr']}.pth"
+    return {**config, **TrainingRunner(trainer, checkpoint_path, max_epochs=50, patience=3).run()}
+
+if __name__ == '__main__':
+    configs = [
+        {'n_layers': n_layers, 'mode': 'precomputed', 'lr': lr}
+        for n_layers, lr in itertools.product([1, 2, 3], [0.001, 0.003])
+    ]
+    for result in run_parallel(train_config, configs, num_workers=3):
+        print(result)